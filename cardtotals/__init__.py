@@ -0,0 +1,18 @@
+from .export import RecordExporter
+from .formats import FileFormat, FixedWidthFormat, ListReportFormat
+from .lease import LeaseLostError
+from .loader import CardTotalsLoader, FileStats, ReconciliationError
+from .parsers import CardRecord, iter_records
+
+__all__ = [
+    "CardRecord",
+    "CardTotalsLoader",
+    "FileFormat",
+    "FileStats",
+    "FixedWidthFormat",
+    "LeaseLostError",
+    "ListReportFormat",
+    "ReconciliationError",
+    "RecordExporter",
+    "iter_records",
+]
@@ -0,0 +1,185 @@
+import logging
+import sqlite3
+from datetime import date, timedelta
+
+from .dates import convert_date_to_int
+
+logger = logging.getLogger(__name__)
+
+# Accounts opened since the given date, from the latest ARCUSYM000 snapshot.
+# Open dates do not change once set, so pulling the accounts opened since
+# the last refresh (less a few days' lookback for late corrections) keeps
+# the index current.  These columns, and opened_in_month below, have to
+# mirror how usp_IsNewAccount decides; AccountIndex checks a sample of its
+# answers against the procedure and stops answering if they disagree.
+LATEST_SNAPSHOT_SQL = "SELECT MAX(PROCESSDATE) FROM dbo.ACCOUNT"
+ACCOUNT_CHANGES_SQL = """
+    SELECT ACCOUNTNUMBER, OPENDATE
+    FROM dbo.ACCOUNT
+    WHERE PROCESSDATE = ?
+    AND OPENDATE >= ?
+"""
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS accounts (
+        account_number TEXT PRIMARY KEY,
+        open_date INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS refresh_state (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+"""
+
+
+def _account_key(account_number):
+    return str(account_number).strip().lstrip("0") or "0"
+
+
+def _int_date(value):
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        return int(value.replace("-", "")[:8])
+    return convert_date_to_int(value)
+
+
+# Keep in step with usp_IsNewAccount: an account is new for a process date
+# when it was opened in that process date's month
+def opened_in_month(open_date, process_date):
+    return open_date // 100 == process_date // 100 and open_date <= process_date
+
+
+class AccountIndex:
+    # Local SQLite copy of ARCUSYM000 account open dates, so NewAcct can be
+    # worked out without a round trip per account.  refresh() pulls only the
+    # accounts opened since the last refresh.  is_new() returns None when
+    # the index cannot answer, for an account it has not seen or a process
+    # date after the snapshot it was refreshed from, and the caller falls
+    # back to usp_IsNewAccount.
+    #
+    # The first verify_first answers, and one in verify_every after that,
+    # are also asked of usp_IsNewAccount by the caller (needs_check() and
+    # check()).  A single disagreement turns the index off for the rest of
+    # the run, as the local rule evidently does not match the procedure.
+
+    def __init__(
+        self,
+        index_file,
+        lookback_days=7,
+        is_new_rule=opened_in_month,
+        verify_first=100,
+        verify_every=100,
+    ):
+        self.index_file = index_file
+        self.lookback_days = lookback_days
+        self.is_new_rule = is_new_rule
+        self.verify_first = verify_first
+        self.verify_every = verify_every
+        self.hits = 0
+        self.misses = 0
+        self.checked = 0
+        self.disagreements = 0
+        self.disabled = False
+        # Looked up from the pipelined lookup thread, never concurrently
+        self._db = sqlite3.connect(index_file, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self.refreshed_through = self._get_state("refreshed_through")
+
+    def close(self):
+        self._db.close()
+
+    def _get_state(self, key):
+        row = self._db.execute(
+            "SELECT value FROM refresh_state WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key, value):
+        self._db.execute(
+            "INSERT OR REPLACE INTO refresh_state (key, value) VALUES (?, ?)",
+            (key, value),
+        )
+
+    # Pull the accounts opened since the last refresh with an ARCUSYM000
+    # cursor.  Returns the number of accounts added or updated.
+    def refresh(self, cursor, fetch_size=10_000):
+        watermark = self._get_state("open_date_watermark")
+        if watermark is None:
+            since = date(1900, 1, 1)
+        else:
+            year, rest = divmod(watermark, 10000)
+            month, day = divmod(rest, 100)
+            since = date(year, month, day) - timedelta(days=self.lookback_days)
+
+        row = cursor.execute(LATEST_SNAPSHOT_SQL).fetchone()
+        if not row or row[0] is None:
+            logger.warning("No ARCUSYM000 account snapshot to refresh the index from")
+            return 0
+        snapshot_date = row[0]
+
+        cursor.execute(ACCOUNT_CHANGES_SQL, snapshot_date, since)
+        changed = 0
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            batch = []
+            for account_number, open_date in rows:
+                open_date = _int_date(open_date)
+                if open_date is None:
+                    continue
+                batch.append((_account_key(account_number), open_date))
+                watermark = max(watermark or 0, open_date)
+            self._db.executemany(
+                "INSERT OR REPLACE INTO accounts (account_number, open_date) VALUES (?, ?)",
+                batch,
+            )
+            changed += len(batch)
+
+        if watermark is not None:
+            self._set_state("open_date_watermark", watermark)
+        self.refreshed_through = _int_date(snapshot_date)
+        self._set_state("refreshed_through", self.refreshed_through)
+        self._db.commit()
+        logger.info(
+            f"Account index refreshed: {changed} account(s) since {since}, through {self.refreshed_through}"
+        )
+        return changed
+
+    # "T" or "F" from the index, or None to ask usp_IsNewAccount
+    def is_new(self, account_number, process_date):
+        if (
+            self.disabled
+            or self.refreshed_through is None
+            or process_date > self.refreshed_through
+        ):
+            self.misses += 1
+            return None
+        row = self._db.execute(
+            "SELECT open_date FROM accounts WHERE account_number = ?",
+            (_account_key(account_number),),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return "T" if self.is_new_rule(row[0], process_date) else "F"
+
+    # Whether the answer just given should be checked against the procedure
+    def needs_check(self):
+        return self.hits <= self.verify_first or self.hits % self.verify_every == 0
+
+    # Compare an answer with usp_IsNewAccount's, turning the index off if
+    # they differ
+    def check(self, account_number, process_date, answer, expected):
+        self.checked += 1
+        if answer == expected:
+            return True
+        self.disagreements += 1
+        if not self.disabled:
+            logger.warning(
+                f"Account index answered {answer} for account {account_number} on {process_date} but usp_IsNewAccount answered {expected}, using usp_IsNewAccount for the rest of the run"
+            )
+        self.disabled = True
+        return False
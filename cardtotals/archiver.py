@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import queue
+import threading
+
+from .fileio import archive_file
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundArchiver:
+    # Archives processed files on a worker thread so the loader can start
+    # parsing the next file straight away.  Every request is appended to a
+    # journal (one JSON object per line) and fsync'd before it is queued, and
+    # marked done once the file is in the archive.  Requests still pending
+    # in the journal on start up, e.g. after a crash, are queued again.
+
+    def __init__(
+        self,
+        journal_file="archive_queue.jsonl",
+        compress=False,
+        verify=False,
+    ):
+        self.journal_file = journal_file
+        self.compress = compress
+        self.verify = verify
+        self.failed = []
+
+        self._queue = queue.Queue()
+        self._journal_lock = threading.Lock()
+        self._worker = threading.Thread(
+            target=self._run, name="card-totals-archiver", daemon=True
+        )
+
+        pending = self._read_pending()
+        self._rewrite_journal(pending)
+        self._worker.start()
+        for entry in pending:
+            logger.info(f"Resuming archive of {entry['path']} from journal")
+            self._queue.put(entry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # Queue a file for archiving.  Returns once the request is durable.
+    def submit(self, path, archive_directory):
+        entry = {
+            "op": "queued",
+            "path": path,
+            "archive_directory": archive_directory,
+            "compress": self.compress,
+        }
+        self._append_journal(entry)
+        self._queue.put(entry)
+
+    # Block until every queued file has been archived
+    def drain(self):
+        self._queue.join()
+
+    def close(self):
+        if self._worker.is_alive():
+            self._queue.put(None)
+            self._worker.join()
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            try:
+                if entry is None:
+                    return
+                self._archive(entry)
+            finally:
+                self._queue.task_done()
+
+    def _archive(self, entry):
+        path = entry["path"]
+        try:
+            if os.path.exists(path):
+                destination = archive_file(
+                    path,
+                    entry["archive_directory"],
+                    compress=entry["compress"],
+                    verify=self.verify,
+                )
+                logger.info(f"Moved file to archive: {destination}")
+            else:
+                # Already moved before a crash, only the done record is missing
+                logger.info(f"File already archived: {path}")
+            self._append_journal({"op": "done", "path": path})
+        except Exception as e:
+            # Leave the request pending in the journal so it is retried on
+            # the next start
+            logger.error(f"Error archiving file {path}: {e}")
+            self.failed.append((path, str(e)))
+
+    def _append_journal(self, entry):
+        with self._journal_lock:
+            with open(self.journal_file, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _read_pending(self):
+        pending = {}
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, "r") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-write
+                        continue
+                    if entry["op"] == "queued":
+                        pending[entry["path"]] = entry
+                    elif entry["op"] == "done":
+                        pending.pop(entry["path"], None)
+        return list(pending.values())
+
+    # Compact the journal down to the requests that are still pending
+    def _rewrite_journal(self, pending):
+        temp_file = self.journal_file + ".tmp"
+        with open(temp_file, "w") as f:
+            for entry in pending:
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.journal_file)
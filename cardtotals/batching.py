@@ -0,0 +1,45 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveBatchSize:
+    # Picks the number of rows per upsert batch from how long batches take,
+    # AIMD style: while batches finish within target_seconds and without
+    # transient errors the size grows by step rows, and on a slow batch or
+    # a retry it is cut by decrease.  With minimum == maximum the size is
+    # fixed.
+
+    def __init__(
+        self,
+        initial=500,
+        minimum=50,
+        maximum=5000,
+        target_seconds=2.0,
+        step=None,
+        decrease=0.5,
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+        self.step = step or max(1, minimum)
+        self.decrease = decrease
+        self.size = min(max(initial, minimum), maximum)
+
+    # Feed back one batch's rows, elapsed seconds and transient error count.
+    # Returns the size to use for the next batch.
+    def observe(self, rows, seconds, errors=0):
+        if errors or seconds > self.target_seconds:
+            size = max(self.minimum, int(self.size * self.decrease))
+        elif rows >= self.size:
+            # Only grow when the batch was full, a short final batch says
+            # nothing about a bigger one
+            size = min(self.maximum, self.size + self.step)
+        else:
+            size = self.size
+        if size != self.size:
+            logger.debug(
+                f"Batch size {self.size} -> {size} after {rows} rows in {seconds:.2f}s"
+            )
+            self.size = size
+        return size
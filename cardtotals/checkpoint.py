@@ -0,0 +1,157 @@
+import os
+import socket
+
+
+# Function to read the checkpoint file
+def read_checkpoint(checkpoint_file):
+    if os.path.exists(checkpoint_file):
+        with open(checkpoint_file, "r") as f:
+            checkpoints = {}
+            for line in f:
+                filename, line_number = line.strip().split(",")
+                checkpoints[filename] = int(line_number)
+            return checkpoints
+    return {}
+
+
+# Function to write every checkpoint entry back to the checkpoint file
+def write_checkpoint(checkpoint_file, checkpoints):
+    with open(checkpoint_file, "w") as f:
+        for file, line_num in checkpoints.items():
+            f.write(f"{file},{line_num}\n")
+
+
+class Checkpoints:
+    # Checkpoint entries kept in memory and written through to the checkpoint
+    # file, so a long load does not re-read the whole file for every line.
+    # A value of 0 marks a file as fully processed.
+
+    transactional = False
+
+    def __init__(self, checkpoint_file="checkpoint.txt"):
+        self.checkpoint_file = checkpoint_file
+        self._checkpoints = read_checkpoint(checkpoint_file)
+
+    def get(self, filename, default=None):
+        return self._checkpoints.get(filename, default)
+
+    def update(self, filename, line_number):
+        self._checkpoints[filename] = line_number
+        write_checkpoint(self.checkpoint_file, self._checkpoints)
+
+    def reload(self):
+        self._checkpoints = read_checkpoint(self.checkpoint_file)
+
+
+class SharedCheckpoints:
+    # Checkpoints for several loader hosts, kept as one <file>.checkpoint
+    # per source file in a shared directory.  Each file is only written by
+    # the host holding its lease, and is replaced atomically, so hosts never
+    # overwrite each other's progress.  Reads go to the share so a host
+    # taking over an expired lease resumes where the last one stopped.
+
+    transactional = False
+
+    def __init__(self, checkpoint_directory):
+        self.checkpoint_directory = checkpoint_directory
+        os.makedirs(checkpoint_directory, exist_ok=True)
+
+    def _checkpoint_path(self, filename):
+        return os.path.join(self.checkpoint_directory, filename + ".checkpoint")
+
+    def get(self, filename, default=None):
+        try:
+            with open(self._checkpoint_path(filename), "r") as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return default
+
+    def update(self, filename, line_number):
+        path = self._checkpoint_path(filename)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(f"{line_number}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def reload(self):
+        pass
+
+
+CREATE_CHECKPOINT_TABLE_SQL = """
+    IF OBJECT_ID(N'{table}', N'U') IS NULL
+    CREATE TABLE {table} (
+        FileName NVARCHAR(260) NOT NULL PRIMARY KEY,
+        LineNumber INT NOT NULL,
+        Host NVARCHAR(128) NULL,
+        UpdatedAt DATETIME2 NOT NULL
+    )
+"""
+
+GET_CHECKPOINT_SQL = "SELECT LineNumber FROM {table} WHERE FileName = ?"
+
+SET_CHECKPOINT_SQL = """
+    MERGE {table} WITH (HOLDLOCK) AS target
+    USING (SELECT ? AS FileName) AS source
+    ON target.FileName = source.FileName
+    WHEN MATCHED THEN
+        UPDATE SET LineNumber = ?, Host = ?, UpdatedAt = SYSDATETIME()
+    WHEN NOT MATCHED THEN
+        INSERT (FileName, LineNumber, Host, UpdatedAt)
+        VALUES (source.FileName, ?, ?, SYSDATETIME());
+"""
+
+
+class DatabaseCheckpoints:
+    # Checkpoints kept in a kRAP table.  stage() writes a checkpoint in the
+    # open transaction on the upsert connection, so it commits or rolls back
+    # with the batch it describes: a crash can neither replay committed rows
+    # nor skip uncommitted ones, and any host can resume the file.  update()
+    # commits on its own, for the fully processed marker.  The table is
+    # created on first use.
+
+    transactional = True
+
+    def __init__(self, get_cursor, commit, table="debit.CardTotalsCheckpoint"):
+        self.get_cursor = get_cursor
+        self.commit = commit
+        self.table = table
+        self.host = socket.gethostname()
+        self._table_ready = False
+
+    def _ensure_table(self):
+        if not self._table_ready:
+            self.get_cursor().execute(
+                CREATE_CHECKPOINT_TABLE_SQL.format(table=self.table)
+            )
+            self.commit()
+            self._table_ready = True
+
+    def get(self, filename, default=None):
+        self._ensure_table()
+        row = (
+            self.get_cursor()
+            .execute(GET_CHECKPOINT_SQL.format(table=self.table), filename)
+            .fetchone()
+        )
+        return default if row is None else row[0]
+
+    # Write a checkpoint without committing it
+    def stage(self, filename, line_number):
+        self.get_cursor().execute(
+            SET_CHECKPOINT_SQL.format(table=self.table),
+            filename,
+            line_number,
+            self.host,
+            line_number,
+            self.host,
+        )
+
+    def update(self, filename, line_number):
+        self._ensure_table()
+        self.stage(filename, line_number)
+        self.commit()
+
+    def reload(self):
+        pass
@@ -0,0 +1,84 @@
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+
+from .history import HISTORY_FILENAME, RunHistory
+from .loader import CardTotalsLoader
+from .logs import close_logging, configure_logging, remove_old_log
+from .profiling import FileProfiler, add_profile_arguments
+from .progress import STATUS_FILENAME, ProgressReporter
+from .report import format_run_report, write_run_report
+
+
+def parse_args(argv=None, description="Load EFT card totals into kRAP"):
+    parser = argparse.ArgumentParser(description=description)
+    add_profile_arguments(parser)
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="show a one-line progress update on the console",
+    )
+    return parser.parse_args(argv)
+
+
+# The body of every entry point: load each file in directory, log and save
+# the run report, append the run to the run history (in the logs directory
+# unless history_file is given) and remove old logs.  Progress is written to
+# progress.json in the logs directory as the load runs.  loader_options go
+# to CardTotalsLoader.  The log handlers are removed again when the run
+# ends, so run can be called repeatedly in one process.
+def run(
+    directory,
+    log_directory,
+    argv=None,
+    file_level=logging.DEBUG,
+    history_file=None,
+    **loader_options,
+):
+    args = parse_args(argv)
+    started = datetime.now()
+    configure_logging(log_directory, file_level=file_level)
+
+    try:
+        if args.profile:
+            loader_options["profiler"] = FileProfiler(
+                log_directory, trace_memory=args.trace_memory
+            )
+
+        if "progress" not in loader_options:
+            loader_options["progress"] = ProgressReporter(
+                os.path.join(log_directory, STATUS_FILENAME), console=args.progress
+            )
+
+        # Estimate the run's makespan from past throughput
+        history_file = history_file or os.path.join(log_directory, HISTORY_FILENAME)
+        if "bytes_per_second" not in loader_options and os.path.exists(history_file):
+            try:
+                with RunHistory(history_file) as history:
+                    loader_options["bytes_per_second"] = history.bytes_per_second()
+            except Exception as e:
+                logging.error(f"Error reading run history: {e}")
+
+        # Process each file sequentially
+        with CardTotalsLoader(**loader_options) as loader:
+            results = loader.load_directory(directory)
+
+        logging.info(format_run_report(results, loader.schedule))
+        write_run_report(
+            results, os.path.join(log_directory, "run_report.log"), loader.schedule
+        )
+        try:
+            with RunHistory(history_file) as history:
+                history.record_run(
+                    results, started, script=os.path.basename(sys.argv[0]) or None
+                )
+        except Exception as e:
+            logging.error(f"Error recording run history: {e}")
+
+        # Remove log files older than 90 days
+        remove_old_log(log_directory)
+        return results
+    finally:
+        close_logging()
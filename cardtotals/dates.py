@@ -0,0 +1,83 @@
+import calendar
+from datetime import date, datetime, timedelta
+
+
+def get_month_end(int_date):
+    # Convert the integer date to a string in the format YYYY-MM-DD
+    date_str = str(int_date)
+    date_str = f"{date_str[:4]}-{date_str[4:6]}-{date_str[6:]}"
+
+    # Convert the date string to a datetime object
+    input_date = datetime.strptime(date_str, "%Y-%m-%d")
+
+    # Calculate the first day of the next month from the input date
+    if input_date.month == 12:
+        first_day_of_next_month = input_date.replace(
+            year=input_date.year + 1, month=1, day=1
+        )
+    else:
+        first_day_of_next_month = input_date.replace(month=input_date.month + 1, day=1)
+
+    # Calculate the last day of the current month from the input date
+    last_day_of_current_month = first_day_of_next_month - timedelta(days=1)
+
+    return last_day_of_current_month
+
+
+def convert_date_to_int(date):
+    return int(date.strftime("%Y%m%d"))
+
+
+# Month end of a YYYYMMDD integer date, as a YYYYMMDD integer, using integer
+# arithmetic only
+def month_end_int(int_date):
+    year, month = divmod(int_date // 100, 100)
+    return (year * 100 + month) * 100 + calendar.monthrange(year, month)[1]
+
+
+class ProcessDateResolver:
+    # Because we don't keep all processdates, we need to determine the best
+    # processdate to use.  Process dates whose month end is older than the
+    # retention window resolve to that month end, newer ones to themselves.
+    #
+    # The answers are kept in a table keyed by the integer date, filled in
+    # up front for the last couple of years and memoized for anything else,
+    # so resolving a row is a dict lookup.
+
+    def __init__(self, retention_days=90, precompute_days=730, today=None):
+        self.retention_days = retention_days
+        self.precompute_days = precompute_days
+        self._fixed_today = today
+        self._today = None
+        self._table = {}
+        self.refresh()
+
+    # Rebuild the table when the day has changed since it was built, so a
+    # long-lived loader keeps using the right retention cutoff
+    def refresh(self):
+        today = self._fixed_today or date.today()
+        if today == self._today:
+            return
+        self._today = today
+
+        # A month end on the cutoff day itself is older than the cutoff
+        # datetime the original comparison used, hence <= below
+        self.cutoff = convert_date_to_int(today - timedelta(days=self.retention_days))
+        self._table = {}
+        day = today - timedelta(days=self.precompute_days)
+        while day <= today:
+            self.best_process_date(convert_date_to_int(day))
+            day += timedelta(days=1)
+
+    def best_process_date(self, process_date_int):
+        best_processdate = self._table.get(process_date_int)
+        if best_processdate is None:
+            # The default is the process date passed in
+            best_processdate = process_date_int
+
+            # Check if the monthend is older than the retention cutoff
+            month_end = month_end_int(process_date_int)
+            if month_end <= self.cutoff:
+                best_processdate = month_end
+            self._table[process_date_int] = best_processdate
+        return best_processdate
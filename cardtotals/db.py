@@ -0,0 +1,56 @@
+try:
+    import pyodbc
+except ImportError:  # Only needed to connect, parsing and tests run without it
+    pyodbc = None
+
+DEFAULT_SERVER = "VSARCU02"
+
+# Upsert connections run with autocommit on and open and close their own
+# transactions.  With autocommit off the driver turns IMPLICIT_TRANSACTIONS
+# on, where a BEGIN TRANSACTION nests inside the implicit transaction and a
+# commit only brings @@TRANCOUNT back to 1, committing nothing.
+COMMIT_SQL = "IF @@TRANCOUNT > 0 COMMIT TRANSACTION"
+ROLLBACK_SQL = "IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION"
+
+
+def create_connection(database_name, server=DEFAULT_SERVER):
+    if pyodbc is None:
+        raise ImportError("pyodbc is required to connect to SQL Server")
+    drivers = pyodbc.drivers
+
+    # Set up SQL connection
+    if "ODBC Driver 17 for SQL Server" in drivers():
+        odbcDriver = "ODBC Driver 17 for SQL Server"
+    elif "ODBC Driver 13.1 for SQL Server" in drivers():
+        odbcDriver = "ODBC Driver 13.1 for SQL Server"
+    elif "ODBC Driver 13 for SQL Server" in drivers():
+        odbcDriver = "ODBC Driver 13 for SQL Server"
+    else:
+        odbcDriver = ""
+        # raise FunctionError("verifydriver", "Missing database driver")
+
+    connection_string = (
+        f"DRIVER={odbcDriver};"
+        f"SERVER={server};"
+        f"DATABASE={database_name};"
+        "Trusted_Connection=yes;"
+    )
+    return pyodbc.connect(connection_string)
+
+
+# Put a new connection in autocommit mode for explicit transactions
+def use_explicit_transactions(connection):
+    connection.autocommit = True
+    return connection
+
+
+def commit_transaction(cursor):
+    cursor.execute(COMMIT_SQL)
+
+
+def rollback_transaction(cursor):
+    cursor.execute(ROLLBACK_SQL)
+
+
+def change_database(cursor, new_database_name):
+    cursor.execute(f"USE {new_database_name}")
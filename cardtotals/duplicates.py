@@ -0,0 +1,186 @@
+import argparse
+import gzip
+import hashlib
+import logging
+import os
+import sqlite3
+from datetime import datetime
+
+from .fileio import content_size, open_source
+
+logger = logging.getLogger(__name__)
+
+# Bytes at each end of a file covered by the quick hash: the header with
+# the process date at the start, the Record Count: trailer at the end
+QUICK_HASH_BYTES = 64 * 1024
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS loaded_files (
+        filename TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        quick_hash TEXT NOT NULL,
+        full_hash TEXT,
+        source_path TEXT,
+        loaded_at TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS loaded_files_size ON loaded_files (size);
+"""
+
+
+# Hash of the first and last QUICK_HASH_BYTES of the content
+def quick_hash(path, size):
+    digest = hashlib.sha256()
+    with open_source(path, binary=True) as f:
+        digest.update(f.read(QUICK_HASH_BYTES))
+        tail_start = max(QUICK_HASH_BYTES, size - QUICK_HASH_BYTES)
+        if isinstance(f, gzip.GzipFile) or not f.seekable():
+            # Compressed, read through to the tail
+            remaining = tail_start - QUICK_HASH_BYTES
+            while remaining > 0:
+                block = f.read(min(remaining, 1024 * 1024))
+                if not block:
+                    break
+                remaining -= len(block)
+        else:
+            f.seek(tail_start)
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+# Streaming SHA-256 of the content
+def full_hash(path):
+    digest = hashlib.sha256()
+    with open_source(path, binary=True) as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DuplicateDetector:
+    # Recognises a file whose content was already loaded, e.g. the same
+    # report sent twice under different names, before any parsing or
+    # database work.  Loaded files are recorded by content size and a hash
+    # of their first and last 64 KiB only.  An arriving file is only hashed
+    # at all when a loaded file has the same size, and only hashed in full,
+    # along with the loaded file's archived copy, when the quick hash
+    # matches too; the loaded file's full hash is then kept for next time.
+    # Sizes and hashes are of the decompressed content, so a gzipped copy
+    # matches the original.  Files already in the archive are recorded with
+    # python -m cardtotals.duplicates index.
+
+    def __init__(self, index_file, archive_directory=None):
+        self.index_file = index_file
+        self.archive_directory = archive_directory
+        self._db = sqlite3.connect(index_file)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    # The name of an already loaded file with the same content, or None
+    def find(self, path):
+        size = content_size(path)
+        candidates = self._db.execute(
+            "SELECT rowid, filename, quick_hash, full_hash, source_path FROM loaded_files WHERE size = ?",
+            (size,),
+        ).fetchall()
+        if not candidates:
+            return None
+        quick = quick_hash(path, size)
+        candidates = [row for row in candidates if row[2] == quick]
+        if not candidates:
+            return None
+
+        full = full_hash(path)
+        for rowid, filename, _, loaded_hash, source_path in candidates:
+            if loaded_hash is None:
+                loaded_hash = self._full_hash_of(rowid, filename, source_path)
+            if loaded_hash == full:
+                return filename
+        return None
+
+    # Hash a loaded file in full where it is now, in the archive or still
+    # where it was loaded from, and keep the hash
+    def _full_hash_of(self, rowid, filename, source_path):
+        locations = []
+        if self.archive_directory:
+            locations.append(os.path.join(self.archive_directory, filename))
+            locations.append(os.path.join(self.archive_directory, filename + ".gz"))
+        if source_path:
+            locations.append(source_path)
+        for location in locations:
+            if os.path.isfile(location):
+                loaded_hash = full_hash(location)
+                with self._db:
+                    self._db.execute(
+                        "UPDATE loaded_files SET full_hash = ? WHERE rowid = ?",
+                        (loaded_hash, rowid),
+                    )
+                return loaded_hash
+        logger.warning(
+            f"Cannot find loaded file {filename} to compare with, treating it as different"
+        )
+        return None
+
+    # Remember a file that has been loaded
+    def record(self, path, filename=None):
+        size = content_size(path)
+        with self._db:
+            self._db.execute(
+                "INSERT INTO loaded_files (filename, size, quick_hash, source_path, loaded_at) VALUES (?, ?, ?, ?, ?)",
+                (
+                    filename or os.path.basename(path),
+                    size,
+                    quick_hash(path, size),
+                    os.path.abspath(path),
+                    datetime.now().isoformat(sep=" ", timespec="seconds"),
+                ),
+            )
+
+    # Record every file in a directory not recorded yet, e.g. the archive
+    # before the detector is first used
+    def index_directory(self, directory):
+        recorded = {
+            row[0] for row in self._db.execute("SELECT filename FROM loaded_files")
+        }
+        count = 0
+        for filename in os.listdir(directory):
+            path = os.path.join(directory, filename)
+            if (
+                not os.path.isfile(path)
+                or filename.endswith(".partial")
+                or filename in recorded
+            ):
+                continue
+            try:
+                self.record(path, filename)
+                count += 1
+            except Exception as e:
+                logger.error(f"Error indexing {path} for duplicate detection: {e}")
+        logger.info(f"Indexed {count} archived file(s) for duplicate detection")
+        return count
+
+
+# python -m cardtotals.duplicates --index-file FILE index DIRECTORY
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Maintain the index of loaded files used to skip duplicates"
+    )
+    parser.add_argument("--index-file", required=True, help="duplicate index file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    index = subparsers.add_parser(
+        "index", help="record the files in a directory, e.g. the Archive, as loaded"
+    )
+    index.add_argument("directory")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    detector = DuplicateDetector(args.index_file)
+    try:
+        detector.index_directory(args.directory)
+    finally:
+        detector.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import csv
+import logging
+import os
+
+from .fileio import COMPRESSED_SUFFIXES
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Parquet and Arrow output need pyarrow, CSV does not
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_COLUMNS = [
+    "ProcessDate",
+    "AccountNumber",
+    "ReferenceId",
+    "NewAcct",
+    "CardNumber",
+    "Name",
+    "Address",
+    "City",
+    "ZIPCODE",
+    "DBA",
+]
+
+EXPORT_FORMATS = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}
+
+# Where the exports of resumed files go, as they lack the rows committed
+# before the resume.  Dataset readers pass over _ prefixed directories.
+INCOMPLETE_DIRECTORY = "_incomplete"
+
+
+# Names the source file a partition file was exported from.  Hidden, so
+# dataset readers scanning the partition directories pass over it.
+def _source_path(path):
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, f".{filename}.source")
+
+
+# The source file name an export is named after, without .gz or .zip
+def export_stem(filename):
+    filename = os.path.basename(filename)
+    if filename.lower().endswith(COMPRESSED_SUFFIXES):
+        filename = os.path.splitext(filename)[0]
+    return filename
+
+
+# The source file an existing partition file was exported from, or None
+def export_source(path):
+    try:
+        with open(_source_path(path), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _arrow_schema():
+    return pyarrow.schema(
+        [("ProcessDate", pyarrow.int32())]
+        + [(column, pyarrow.string()) for column in EXPORT_COLUMNS[1:]]
+    )
+
+
+class _PartitionWriter:
+    # Buffers one partition's rows column by column and writes them out a
+    # record batch at a time
+
+    def __init__(self, path, export_format, batch_size, source):
+        self.path = path
+        self.source = source
+        self.partial_path = path + ".partial"
+        self.export_format = export_format
+        self.batch_size = batch_size
+        self.rows = 0
+        self._columns = {column: [] for column in EXPORT_COLUMNS}
+        self._buffered = 0
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if export_format == "parquet":
+            self._writer = pyarrow.parquet.ParquetWriter(
+                self.partial_path, _arrow_schema()
+            )
+        elif export_format == "arrow":
+            self._sink = pyarrow.OSFile(self.partial_path, "wb")
+            self._writer = pyarrow.ipc.new_file(self._sink, _arrow_schema())
+        else:
+            self._sink = open(self.partial_path, "w", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._sink)
+            self._writer.writerow(EXPORT_COLUMNS)
+
+    def write(self, row):
+        for column, value in zip(EXPORT_COLUMNS, row):
+            self._columns[column].append(value)
+        self._buffered += 1
+        if self._buffered >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffered:
+            return
+        if self.export_format == "csv":
+            self._writer.writerows(
+                zip(*(self._columns[column] for column in EXPORT_COLUMNS))
+            )
+        else:
+            self._writer.write_batch(
+                pyarrow.RecordBatch.from_pydict(self._columns, schema=_arrow_schema())
+            )
+        self.rows += self._buffered
+        self._columns = {column: [] for column in EXPORT_COLUMNS}
+        self._buffered = 0
+
+    def close(self, commit=True):
+        if commit:
+            self.flush()
+        if self.export_format == "csv":
+            self._sink.close()
+        else:
+            self._writer.close()
+            if self.export_format == "arrow":
+                self._sink.close()
+        if commit:
+            os.replace(self.partial_path, self.path)
+            if self.source is not None:
+                with open(_source_path(self.path), "w", encoding="utf-8") as f:
+                    f.write(self.source + "\n")
+        else:
+            os.remove(self.partial_path)
+
+
+class RecordExporter:
+    # Columnar export of parsed card totals, partitioned by ProcessDate as
+    # <directory>/process_date=YYYYMMDD/<source file>.<format>.  The
+    # partition key is named differently from the ProcessDate column so
+    # dataset readers do not see two conflicting types for it.  Output is
+    # written under a .partial name and only renamed into place once the
+    # source file has been fully processed.  <source file> is the whole
+    # source file name less .gz or .zip, and the name of the file each
+    # partition file came from is kept beside it in a hidden .source file so one
+    # source's export is never replaced by another's.
+    #
+    # A file resumed part way through is exported as incomplete, under
+    # <directory>/_incomplete/, so a partial export is never published in
+    # place of a whole one.
+
+    def __init__(self, directory, export_format="parquet", batch_size=50_000):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {export_format}")
+        if export_format != "csv" and pyarrow is None:
+            raise ImportError(f"pyarrow is required for {export_format} export")
+        self.directory = directory
+        self.export_format = export_format
+        self.batch_size = batch_size
+        self._filename = None
+        self._complete = True
+        self._writers = {}
+
+    # Start the export of a source file.  complete=False when only the rows
+    # after a checkpoint will be written.
+    def open_file(self, filename, complete=True):
+        self.abort_file()
+        self._filename = filename
+        self._complete = complete
+
+    def write(self, record, new_acct=None):
+        writer = self._writers.get(record.process_date)
+        if writer is None:
+            directory = self.directory
+            if not self._complete:
+                directory = os.path.join(directory, INCOMPLETE_DIRECTORY)
+            path = os.path.join(
+                directory,
+                f"process_date={record.process_date}",
+                export_stem(self._filename) + EXPORT_FORMATS[self.export_format],
+            )
+            # Reloading a file replaces its own export, never another file's
+            if self._complete and os.path.exists(path):
+                source = export_source(path)
+                if source != self._filename:
+                    raise ValueError(
+                        f"Export {path} was written from {source or 'an unknown file'}, not replacing it with rows from {self._filename}"
+                    )
+            writer = _PartitionWriter(
+                path,
+                self.export_format,
+                self.batch_size,
+                self._filename if self._complete else None,
+            )
+            self._writers[record.process_date] = writer
+        writer.write(
+            (
+                record.process_date,
+                record.acct_num,
+                record.ref_num,
+                new_acct,
+                record.card_num,
+                record.name,
+                record.address,
+                record.city,
+                record.zipcode,
+                record.dba,
+            )
+        )
+
+    # Finish the current source file's output and move it into place.
+    # Returns the number of rows exported.
+    def close_file(self):
+        rows = 0
+        for writer in self._writers.values():
+            writer.close()
+            rows += writer.rows
+            logger.info(f"Exported {writer.rows} rows to {writer.path}")
+        self._writers = {}
+        self._filename = None
+        return rows
+
+    # Discard the current source file's partial output
+    def abort_file(self):
+        for writer in self._writers.values():
+            try:
+                writer.close(commit=False)
+            except Exception as e:
+                logger.error(f"Error discarding export {writer.partial_path}: {e}")
+        self._writers = {}
+        self._filename = None
+
+    def close(self):
+        self.abort_file()
@@ -0,0 +1,103 @@
+import gzip
+import hashlib
+import io
+import os
+import shutil
+import struct
+import zipfile
+
+COMPRESSED_SUFFIXES = (".gz", ".zip")
+
+
+def is_compressed(path):
+    return path.lower().endswith(COMPRESSED_SUFFIXES)
+
+
+# Uncompressed size of a source file, without decompressing it
+def content_size(path):
+    lower_path = path.lower()
+    if lower_path.endswith(".gz"):
+        # ISIZE, the last four bytes of a gzip member, modulo 2**32
+        with open(path, "rb") as f:
+            f.seek(-4, os.SEEK_END)
+            return struct.unpack("<I", f.read(4))[0]
+    if lower_path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            return sum(
+                info.file_size for info in archive.infolist() if not info.is_dir()
+            )
+    return os.path.getsize(path)
+
+
+# Open an EFT source file for reading, decompressing .gz and .zip inputs on
+# the fly instead of unpacking them to disk first.  Text mode by default,
+# raw bytes with binary=True.
+def open_source(path, encoding=None, binary=False):
+    lower_path = path.lower()
+    if lower_path.endswith(".gz"):
+        if binary:
+            return gzip.open(path, mode="rb")
+        return gzip.open(path, mode="rt", encoding=encoding)
+    if lower_path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            members = [info for info in archive.infolist() if not info.is_dir()]
+            if len(members) != 1:
+                raise ValueError(
+                    f"Expected a single file in zip archive {path}, found {len(members)}"
+                )
+            # The member keeps the underlying file open after the archive
+            # object itself is closed
+            stream = archive.open(members[0])
+        if binary:
+            return stream
+        return io.TextIOWrapper(stream, encoding=encoding)
+    if binary:
+        return open(path, mode="rb")
+    return open(path, mode="r", encoding=encoding)
+
+
+# Streaming SHA-256 of a file, decompressing gzip files we archived
+def file_checksum(path, gzipped=False):
+    digest = hashlib.sha256()
+    opener = gzip.open if gzipped else open
+    with opener(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Move a processed file into the archive directory, gzip compressing it on
+# the way when requested.  With verify the copy is written under a .partial
+# name and checked against the source before the source is removed.
+# Returns the path of the archived file.
+def archive_file(
+    path, archive_directory, compress=False, compresslevel=6, verify=False
+):
+    filename = os.path.basename(path)
+    compress = compress and not is_compressed(path)
+    if not compress and not verify:
+        destination = os.path.join(archive_directory, filename)
+        shutil.move(path, destination)
+        return destination
+
+    destination = os.path.join(
+        archive_directory, filename + (".gz" if compress else "")
+    )
+    partial = destination + ".partial"
+    digest = hashlib.sha256()
+    if compress:
+        target = gzip.open(partial, "wb", compresslevel=compresslevel)
+    else:
+        target = open(partial, "wb")
+    with open(path, "rb") as source, target:
+        for block in iter(lambda: source.read(1024 * 1024), b""):
+            digest.update(block)
+            target.write(block)
+
+    if verify and file_checksum(partial, gzipped=compress) != digest.hexdigest():
+        os.remove(partial)
+        raise IOError(f"Checksum mismatch archiving {path} to {destination}")
+
+    os.replace(partial, destination)
+    os.remove(path)
+    return destination
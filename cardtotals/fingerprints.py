@@ -0,0 +1,109 @@
+import hashlib
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS fingerprints (
+        account_number TEXT NOT NULL,
+        reference_id TEXT NOT NULL,
+        card_number TEXT NOT NULL,
+        fingerprint BLOB NOT NULL,
+        last_seen INTEGER NOT NULL,
+        PRIMARY KEY (account_number, reference_id, card_number)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS fingerprints_last_seen ON fingerprints (last_seen);
+"""
+
+
+# Hash of everything usp_UpsertCardTotals writes for a row.  ProcessDate and
+# NewAcct are included so a row for a new process date is never skipped.
+def row_fingerprint(record, new_acct):
+    values = (
+        str(record.process_date),
+        new_acct or "",
+        record.name,
+        record.address,
+        record.city,
+        record.zipcode,
+        record.dba,
+    )
+    return hashlib.blake2b("\x1f".join(values).encode("utf-8"), digest_size=16).digest()
+
+
+class FingerprintStore:
+    # Local SQLite store of the last row loaded for each (AccountNumber,
+    # ReferenceId, CardNumber), so a record identical to the one already in
+    # CardTotals can be skipped before it reaches the database.  Rows are
+    # staged as they are upserted and only written once the database commit
+    # succeeds.  Past max_rows the rows with the oldest process dates are
+    # dropped.  force_reload skips nothing but still refreshes the store.
+
+    def __init__(self, store_file, max_rows=5_000_000, force_reload=False):
+        self.store_file = store_file
+        self.max_rows = max_rows
+        self.force_reload = force_reload
+        self._db = sqlite3.connect(store_file)
+        self._db.executescript(_SCHEMA)
+        self._pending = []
+
+    def close(self):
+        self._pending = []
+        self._db.close()
+
+    def unchanged(self, record, new_acct):
+        if self.force_reload:
+            return False
+        row = self._db.execute(
+            "SELECT fingerprint FROM fingerprints"
+            " WHERE account_number = ? AND reference_id = ? AND card_number = ?",
+            (record.acct_num, record.ref_num, record.card_num),
+        ).fetchone()
+        return row is not None and row[0] == row_fingerprint(record, new_acct)
+
+    # Remember a row upserted in the open database transaction
+    def stage(self, record, new_acct):
+        self._pending.append(
+            (
+                record.acct_num,
+                record.ref_num,
+                record.card_num,
+                row_fingerprint(record, new_acct),
+                record.process_date,
+            )
+        )
+
+    # Save the staged rows once the database transaction has committed
+    def commit(self):
+        if not self._pending:
+            return
+        self._db.executemany(
+            "INSERT OR REPLACE INTO fingerprints"
+            " (account_number, reference_id, card_number, fingerprint, last_seen)"
+            " VALUES (?, ?, ?, ?, ?)",
+            self._pending,
+        )
+        self._db.commit()
+        self._pending = []
+
+    # Forget the staged rows of a rolled back transaction
+    def discard(self):
+        self._pending = []
+
+    # Drop the oldest rows beyond max_rows
+    def prune(self):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM fingerprints").fetchone()
+        excess = count - self.max_rows
+        if excess <= 0:
+            return 0
+        self._db.execute(
+            "DELETE FROM fingerprints"
+            " WHERE (account_number, reference_id, card_number) IN ("
+            " SELECT account_number, reference_id, card_number FROM fingerprints"
+            " ORDER BY last_seen LIMIT ?)",
+            (excess,),
+        )
+        self._db.commit()
+        logger.info(f"Pruned {excess} of {count} row fingerprint(s)")
+        return excess
@@ -0,0 +1,85 @@
+from .listindex import scan_list_report
+from .parsers import iter_fixed_width_records, iter_list_records
+
+
+class FileFormat:
+    # Parser plugin interface for the load engine.  A format says which files
+    # it expects by name, where to resume from a checkpoint, and yields
+    # CardRecords for a file.  open() raises FormatError when a file does not
+    # look like the format, and the engine moves on to the next format.  It
+    # may fill in stats.process_date and stats.trailer_count up front; a
+    # trailer count lets the engine reconcile the load against it.
+
+    name = None
+
+    # Whether this format should be tried first for a file name
+    def claims(self, filename):
+        return False
+
+    # The first line to read for a file checkpointed at checkpoint.  An
+    # exact checkpoint was committed with the rows up to it, so the file
+    # resumes after it.
+    def start_line(self, checkpoint, exact=False):
+        if exact and checkpoint:
+            return checkpoint + 1
+        return checkpoint or 1
+
+    def open(self, path, stats, start_line, encoding=None, on_error=None):
+        raise NotImplementedError
+
+
+class FixedWidthFormat(FileFormat):
+    # EFT files with the process date on the first line and one fixed-width
+    # record per line after it
+
+    name = "fixed"
+
+    def __init__(self, columns=None):
+        self.columns = columns
+
+    def claims(self, filename):
+        return "list" not in filename.lower()
+
+    def open(self, path, stats, start_line, encoding=None, on_error=None):
+        return iter_fixed_width_records(
+            path, start_line, encoding, on_error, columns=self.columns
+        )
+
+
+class ListReportFormat(FileFormat):
+    # List reports: page headers, an HRKEESLER header with the process date,
+    # three line records and a Record Count: trailer.  With index_reports
+    # the report is scanned first so the parser can pass over page headers
+    # and the load can be reconciled with the trailer.
+
+    name = "list"
+
+    def __init__(self, index_reports=True, resume_lines=5):
+        self.index_reports = index_reports
+        self.resume_lines = resume_lines
+
+    def claims(self, filename):
+        return "list" in filename.lower()
+
+    # Back up a few lines so a record split across the checkpoint is reread,
+    # unless the checkpoint is exact.  Lines after the first of a record do
+    # not look like a record start and are passed over.
+    def start_line(self, checkpoint, exact=False):
+        if exact:
+            return super().start_line(checkpoint, exact)
+        return max(1, (checkpoint or 1) - self.resume_lines)
+
+    def open(self, path, stats, start_line, encoding=None, on_error=None):
+        if not self.index_reports:
+            return iter_list_records(path, start_line, encoding, on_error)
+
+        # Find the header, page breaks and trailer up front so the parser
+        # can pass over page headers without checking them
+        index = scan_list_report(path)
+        stats.process_date = index.process_date
+        stats.trailer_count = index.record_count
+        return iter_list_records(path, start_line, encoding, on_error, index=index)
+
+
+def default_formats(index_list_reports=True):
+    return [ListReportFormat(index_list_reports), FixedWidthFormat()]
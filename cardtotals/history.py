@@ -0,0 +1,230 @@
+import argparse
+import os
+import socket
+import sqlite3
+from datetime import datetime, timedelta
+
+HISTORY_FILENAME = "run_history.db"
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS runs (
+        run_id INTEGER PRIMARY KEY,
+        started TEXT NOT NULL,
+        finished TEXT NOT NULL,
+        host TEXT NOT NULL,
+        script TEXT,
+        files INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS file_runs (
+        run_id INTEGER NOT NULL REFERENCES runs (run_id),
+        filename TEXT NOT NULL,
+        parser TEXT,
+        status TEXT NOT NULL,
+        file_size INTEGER,
+        records_parsed INTEGER,
+        records_loaded INTEGER,
+        records_rejected INTEGER,
+        errors INTEGER,
+        retries INTEGER,
+        elapsed REAL,
+        db_seconds REAL,
+        parse_seconds REAL,
+        rows_per_second REAL,
+        error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS file_runs_run_id ON file_runs (run_id);
+"""
+
+
+class RunHistory:
+    # SQLite history of every run and the files it processed, kept beside
+    # the logs for capacity planning.  process_log.log is removed after 90
+    # days; this is not.
+
+    def __init__(self, history_file):
+        self.history_file = history_file
+        self._db = sqlite3.connect(history_file)
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    # Append a run and its FileStats results.  Returns the run id.
+    def record_run(self, results, started, finished=None, script=None):
+        finished = finished or datetime.now()
+        with self._db:
+            run_id = self._db.execute(
+                "INSERT INTO runs (started, finished, host, script, files)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (
+                    started.isoformat(sep=" ", timespec="seconds"),
+                    finished.isoformat(sep=" ", timespec="seconds"),
+                    socket.gethostname(),
+                    script,
+                    len(results),
+                ),
+            ).lastrowid
+            self._db.executemany(
+                "INSERT INTO file_runs VALUES"
+                " (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        run_id,
+                        stats.filename,
+                        stats.parser,
+                        stats.status,
+                        stats.file_size,
+                        stats.records_parsed,
+                        stats.records_loaded,
+                        stats.records_rejected,
+                        stats.errors,
+                        stats.retries,
+                        stats.elapsed,
+                        stats.db_seconds,
+                        stats.parse_seconds,
+                        (
+                            stats.records_parsed / stats.elapsed
+                            if stats.elapsed
+                            else None
+                        ),
+                        stats.error,
+                    )
+                    for stats in results
+                ],
+            )
+        return run_id
+
+    # Bytes loaded per second over the loaded files of the last days, or
+    # None without any history
+    def bytes_per_second(self, days=30):
+        since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+        (rate,) = self._db.execute(
+            """
+            SELECT SUM(f.file_size) / NULLIF(SUM(f.elapsed), 0)
+            FROM file_runs f JOIN runs r ON r.run_id = f.run_id
+            WHERE r.started >= ? AND f.status = 'loaded' AND f.file_size > 0
+            """,
+            (since,),
+        ).fetchone()
+        return rate
+
+    # Per day totals for loaded files over the last days
+    def trends(self, days=30):
+        since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+        return self._db.execute(
+            """
+            SELECT substr(r.started, 1, 10) AS day,
+                   COUNT(*) AS files,
+                   SUM(f.file_size) AS bytes,
+                   SUM(f.records_parsed) AS records,
+                   SUM(f.elapsed) AS elapsed,
+                   SUM(f.db_seconds) AS db_seconds,
+                   SUM(f.parse_seconds) AS parse_seconds,
+                   SUM(f.retries) AS retries,
+                   SUM(f.records_parsed) / NULLIF(SUM(f.elapsed), 0) AS rows_per_second,
+                   SUM(f.status = 'failed') AS failed
+            FROM file_runs f JOIN runs r ON r.run_id = f.run_id
+            WHERE r.started >= ? AND f.status IN ('loaded', 'failed')
+            GROUP BY day
+            ORDER BY day
+            """,
+            (since,),
+        ).fetchall()
+
+    # The longest running files over the last days
+    def slowest(self, days=30, limit=20):
+        since = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+        return self._db.execute(
+            """
+            SELECT r.started, f.filename, f.status, f.file_size, f.records_parsed,
+                   f.elapsed, f.db_seconds, f.parse_seconds, f.rows_per_second,
+                   f.retries
+            FROM file_runs f JOIN runs r ON r.run_id = f.run_id
+            WHERE r.started >= ? AND f.status IN ('loaded', 'failed')
+            ORDER BY f.elapsed DESC
+            LIMIT ?
+            """,
+            (since, limit),
+        ).fetchall()
+
+
+def _format_number(value, digits=0):
+    if value is None:
+        return "-"
+    return f"{value:,.{digits}f}"
+
+
+def format_trends(rows):
+    lines = [
+        f"{'Day':<10} {'Files':>6} {'MB':>9} {'Records':>11} {'Elapsed s':>10} "
+        f"{'DB s':>9} {'Parse s':>9} {'Rows/s':>9} {'Retries':>8} {'Failed':>7}"
+    ]
+    for day, files, size, records, elapsed, db, parse, retries, rate, failed in rows:
+        lines.append(
+            f"{day:<10} {files:>6} {_format_number((size or 0) / 1e6, 1):>9} "
+            f"{_format_number(records):>11} {_format_number(elapsed, 1):>10} "
+            f"{_format_number(db, 1):>9} {_format_number(parse, 1):>9} "
+            f"{_format_number(rate):>9} {_format_number(retries):>8} {failed:>7}"
+        )
+    return "\n".join(lines)
+
+
+def format_slowest(rows):
+    lines = [
+        f"{'Started':<19} {'File':<32} {'Status':<7} {'MB':>8} {'Records':>10} "
+        f"{'Elapsed s':>10} {'DB s':>8} {'Parse s':>8} {'Rows/s':>8} {'Retries':>7}"
+    ]
+    for (
+        started,
+        filename,
+        status,
+        size,
+        records,
+        elapsed,
+        db,
+        parse,
+        rate,
+        retries,
+    ) in rows:
+        lines.append(
+            f"{started:<19} {filename:<32} {status:<7} "
+            f"{_format_number((size or 0) / 1e6, 1):>8} {_format_number(records):>10} "
+            f"{_format_number(elapsed, 1):>10} {_format_number(db, 1):>8} "
+            f"{_format_number(parse, 1):>8} {_format_number(rate):>8} "
+            f"{_format_number(retries):>7}"
+        )
+    return "\n".join(lines)
+
+
+# python -m cardtotals.history [--history-file FILE] trends|slowest
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report on card totals load history")
+    parser.add_argument(
+        "--history-file",
+        default=os.path.join("logs", HISTORY_FILENAME),
+        help="run history database (default: logs/run_history.db)",
+    )
+    parser.add_argument("--days", type=int, default=30, help="days to look back")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("trends", help="per day volume and throughput")
+    slowest = subparsers.add_parser("slowest", help="the longest running files")
+    slowest.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.history_file):
+        parser.error(f"No run history at {args.history_file}")
+    with RunHistory(args.history_file) as history:
+        if args.command == "trends":
+            print(format_trends(history.trends(args.days)))
+        else:
+            print(format_slowest(history.slowest(args.days, args.limit)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLostError(Exception):
+    pass
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class FileLeases:
+    # Claims source files in a directory shared by every loader host, so
+    # only one host processes a file at a time.  A lease is a
+    # <file>.lease JSON file created with O_EXCL, which the share makes
+    # atomic, holding the owner and an expiry time.  The owner renews it
+    # while loading; a lease left behind by a crashed host is broken once
+    # it expires and the file is picked up by the next host to look at it.
+    # Hosts' clocks should agree to well within lease_seconds.
+
+    def __init__(self, lease_directory, worker_id=None, lease_seconds=900):
+        self.lease_directory = lease_directory
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self._renewed = {}
+        os.makedirs(lease_directory, exist_ok=True)
+
+    def _lease_path(self, filename):
+        return os.path.join(self.lease_directory, filename + ".lease")
+
+    def _lease_entry(self):
+        return {
+            "owner": self.worker_id,
+            "expires": time.time() + self.lease_seconds,
+        }
+
+    def _read_lease(self, path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # Torn write, treat it as expired once it is old enough
+            try:
+                modified = os.path.getmtime(path)
+            except FileNotFoundError:
+                return None
+            return {"owner": None, "expires": modified + self.lease_seconds}
+
+    # Try to claim a file.  Returns False if another live worker holds it.
+    def acquire(self, filename):
+        path = self._lease_path(filename)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                lease = self._read_lease(path)
+                if lease is None:
+                    continue  # Released in the meantime, try again
+                if lease["owner"] == self.worker_id:
+                    self.renew(filename)
+                    return True
+                if lease["expires"] > time.time():
+                    return False
+                if not self._break_lease(path, lease):
+                    return False
+                continue
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._lease_entry(), f)
+                f.flush()
+                os.fsync(f.fileno())
+            self._renewed[filename] = time.monotonic()
+            return True
+        return False
+
+    # Remove an expired lease.  Only one of several hosts racing to break
+    # it wins the rename, the others go on to the next file.
+    def _break_lease(self, path, lease):
+        stale_path = f"{path}.{uuid.uuid4().hex}.stale"
+        try:
+            os.rename(path, stale_path)
+        except OSError:
+            return False
+        os.remove(stale_path)
+        logger.warning(
+            f"Broke expired lease on {os.path.basename(path)} held by {lease['owner']}"
+        )
+        return True
+
+    # Extend a lease, raising LeaseLostError if another worker took it over
+    def renew(self, filename):
+        path = self._lease_path(filename)
+        lease = self._read_lease(path)
+        if lease is None or lease["owner"] != self.worker_id:
+            raise LeaseLostError(f"Lost the lease on {filename}")
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self._lease_entry(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        self._renewed[filename] = time.monotonic()
+
+    # Renew once a third of the lease has gone by since the last renewal
+    def keep_alive(self, filename):
+        renewed = self._renewed.get(filename, 0)
+        if time.monotonic() - renewed >= self.lease_seconds / 3:
+            self.renew(filename)
+
+    def release(self, filename):
+        self._renewed.pop(filename, None)
+        path = self._lease_path(filename)
+        lease = self._read_lease(path)
+        if lease is not None and lease["owner"] == self.worker_id:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
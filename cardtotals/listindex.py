@@ -0,0 +1,115 @@
+import re
+from collections import namedtuple
+
+from .fileio import open_source
+from .parsers import FormatError, parse_process_date
+
+# Where the interesting lines of a List report are, found in one pass over
+# the raw bytes:
+#   header_line   line number of the first HRKEESLER line
+#   process_date  YYYYMMDD process date parsed from that line
+#   page_breaks   line numbers of the KEESLER FEDERAL CREDIT UNION page headers
+#   skip_lines    every page header, column header, rule, repeated HRKEESLER
+#                 or blank line after the header, which the parser can pass
+#                 over without decoding
+#   trailer_line  line number of the Record Count: trailer, or None
+#   record_count  the trailer's record count, or None
+ListReportIndex = namedtuple(
+    "ListReportIndex",
+    [
+        "header_line",
+        "process_date",
+        "page_breaks",
+        "skip_lines",
+        "trailer_line",
+        "record_count",
+    ],
+)
+
+# One alternation per kind of marker line, matched at the start of any line
+_marker_pattern = re.compile(
+    rb"^(?:(KEESLER FEDERAL CREDIT UNION)"
+    rb"|(?:123456|-------------)"
+    rb"|(HRKEESLER)"
+    rb"|(Record Count:)"
+    rb"|[^\S\n]*$)",
+    re.MULTILINE,
+)
+_record_count_pattern = re.compile(rb"Record Count:\s*([\d,]+)")
+
+
+# Scan a List report block by block for its header, page breaks and trailer
+def scan_list_report(path, block_size=1024 * 1024):
+    header_line = None
+    process_date = None
+    page_breaks = []
+    skip_lines = set()
+    trailer_line = None
+    record_count = None
+
+    line_number = 0  # lines completed before the current match
+    carry = b""
+    done = False
+    with open_source(path, binary=True) as file:
+        while not done:
+            block = file.read(block_size)
+            data = carry + block
+            if not block:
+                if not data:
+                    break
+                if not data.endswith(b"\n"):
+                    data += b"\n"
+                done = True
+
+            # Only scan complete lines, carrying the rest to the next block
+            end = data.rfind(b"\n") + 1
+            if end == 0:
+                carry = data
+                continue
+
+            position = 0
+            for match in _marker_pattern.finditer(data, 0, end):
+                start = match.start()
+                if start >= end:
+                    break  # The empty "line" after the final newline
+                line_number += data.count(b"\n", position, start)
+                position = start
+                current_line = line_number + 1
+
+                if header_line is None:
+                    if match.group(2):
+                        line_end = data.find(b"\n", start)
+                        header = data[start:line_end].decode("latin-1")
+                        header_line = current_line
+                        process_date = parse_process_date(header.rstrip("\r"))
+                    elif match.group(3):
+                        done = True  # Trailer without a header
+                        break
+                    continue
+
+                if match.group(3):
+                    trailer_line = current_line
+                    line_end = data.find(b"\n", start)
+                    count = _record_count_pattern.match(data, start, line_end)
+                    if count:
+                        record_count = int(count.group(1).replace(b",", b""))
+                    done = True
+                    break
+
+                if match.group(1):
+                    page_breaks.append(current_line)
+                skip_lines.add(current_line)
+
+            line_number += data.count(b"\n", position, end)
+            carry = data[end:]
+
+    if header_line is None:
+        raise FormatError("No HRKEESLER header line found")
+    return ListReportIndex(
+        header_line,
+        process_date,
+        page_breaks,
+        frozenset(skip_lines),
+        trailer_line,
+        record_count,
+    )
@@ -0,0 +1,1094 @@
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+
+from .accountindex import AccountIndex
+from .archiver import BackgroundArchiver
+from .batching import AdaptiveBatchSize
+from .checkpoint import Checkpoints, DatabaseCheckpoints, SharedCheckpoints
+from .dates import ProcessDateResolver
+from .db import (
+    DEFAULT_SERVER,
+    change_database,
+    commit_transaction,
+    create_connection,
+    rollback_transaction,
+    use_explicit_transactions,
+)
+from .duplicates import DuplicateDetector
+from .fileio import archive_file, content_size
+from .fingerprints import FingerprintStore
+from .formats import default_formats
+from .lease import FileLeases
+from .parsers import FormatError
+from .partitions import PartitionedWriter
+from .rejects import RejectWriter, format_record
+from .schedule import FileScheduler, ScheduleSummary
+from .sorting import sort_records, upsert_key
+from .writer import BatchUpsertWriter, is_transient_error
+
+logger = logging.getLogger(__name__)
+
+NEW_ACCOUNT_SQL = """
+    DECLARE @Result BIT;
+    EXEC usp_IsNewAccount ?, ?, @Result OUTPUT;
+    SELECT @Result;
+"""
+
+# The older usp_IsNewAccount taking only the account number, with an INT
+# result, which driver.py, List.py and Order.py were written against
+NEW_ACCOUNT_INT_SQL = """
+    DECLARE @Result INT;
+    EXEC usp_IsNewAccount ?, @Result OUTPUT;
+    SELECT @Result;
+"""
+
+NEW_ACCOUNT_PROCS = ("bit", "int")
+
+# Upsert in file order (None), sort each batch, or sort the whole file
+SORT_UPSERTS = (None, "batch", "file")
+
+UPSERT_CARD_TOTALS_SQL = """
+    EXEC debit.usp_UpsertCardTotals
+    @ProcessDate = ?,
+    @AccountNumber = ?,
+    @ReferenceId = ?,
+    @NewAcct = ?,
+    @CardNumber = ?,
+    @Name = ?,
+    @Address = ?,
+    @City = ?,
+    @ZIPCODE = ?,
+    @DBA = ?
+"""
+
+
+class ReconciliationError(Exception):
+    pass
+
+
+# Pass records through, adding the time spent producing them to
+# stats.parse_seconds
+def _timed(records, stats):
+    iterator = iter(records)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                record = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                stats.parse_seconds += time.perf_counter() - started
+            yield record
+    finally:
+        if hasattr(iterator, "close"):
+            iterator.close()
+
+
+def _rate(rows, seconds):
+    return rows / seconds if seconds > 0 else 0.0
+
+
+def _has_key_fields(record):
+    return bool(record.acct_num and record.ref_num and record.card_num)
+
+
+@dataclass
+class FileStats:
+    filename: str
+    parser: str = ""
+    status: str = "pending"
+    process_date: int = None
+    start_line: int = 0
+    last_line: int = 0
+    records_parsed: int = 0
+    records_loaded: int = 0
+    records_skipped: int = 0
+    records_unchanged: int = 0
+    records_exported: int = 0
+    records_rejected: int = 0
+    parse_errors: int = 0
+    errors: int = 0
+    trailer_count: int = None
+    count_mismatch: int = None
+    batches: int = 0
+    batch_size_min: int = 0
+    batch_size_max: int = 0
+    batch_size: int = 0
+    file_size: int = 0
+    retries: int = 0
+    lookup_retries: int = 0
+    db_seconds: float = 0.0
+    parse_seconds: float = 0.0
+    writer_rates: list = field(default_factory=list)
+    elapsed: float = 0.0
+    error: str = ""
+
+
+class CardTotalsLoader:
+    # Loads EFT card total files into kRAP.  Connections and the new account
+    # cache live as long as the loader, so one process can load many files
+    # without reconnecting or repeating usp_IsNewAccount lookups.
+
+    def __init__(
+        self,
+        archive_directory=None,
+        checkpoint_file="checkpoint.txt",
+        server=DEFAULT_SERVER,
+        lookup_database="ARCUSYM000",
+        target_database="kRAP",
+        connection_factory=create_connection,
+        new_account_cache_size=100_000,
+        compress_archive=False,
+        verify_archive=False,
+        background_archive=False,
+        archive_journal_file=None,
+        encoding=None,
+        exporter=None,
+        load_database=True,
+        resolve_process_date=False,
+        retention_days=90,
+        index_list_reports=True,
+        max_count_mismatch=None,
+        reject_directory=None,
+        batch_size=500,
+        adaptive_batch_size=False,
+        min_batch_size=50,
+        max_batch_size=5000,
+        target_batch_seconds=2.0,
+        max_retries=3,
+        retry_backoff=0.5,
+        lease_directory=None,
+        lease_seconds=900,
+        worker_id=None,
+        checkpoint_directory=None,
+        profiler=None,
+        account_index_file=None,
+        formats=None,
+        new_account_proc="bit",
+        sort_upserts=None,
+        sort_memory_records=200_000,
+        sort_temp_directory=None,
+        fingerprint_file=None,
+        max_fingerprints=5_000_000,
+        force_full_reload=False,
+        pipeline_lookups=False,
+        lookup_lookahead=200,
+        schedule_order="listing",
+        priority_patterns=(),
+        expected_workers=1,
+        bytes_per_second=None,
+        duplicate_index_file=None,
+        writers=1,
+        progress=None,
+        checkpoint_table=None,
+    ):
+        if not load_database and exporter is None:
+            raise ValueError("An exporter is required when load_database is False")
+        if sort_upserts not in SORT_UPSERTS:
+            raise ValueError(f"Unknown sort_upserts option: {sort_upserts}")
+        if new_account_proc not in NEW_ACCOUNT_PROCS:
+            raise ValueError(f"Unknown usp_IsNewAccount variant: {new_account_proc}")
+        if account_index_file and new_account_proc == "int":
+            # The INT variant takes no process date to apply the index's rule to
+            raise ValueError(
+                "The account index needs the process date variant of usp_IsNewAccount"
+            )
+        if lease_directory and not (checkpoint_directory or checkpoint_table):
+            # A host taking over a file must see the other hosts' checkpoints
+            raise ValueError(
+                "Leases need shared checkpoints: set checkpoint_directory or checkpoint_table"
+            )
+        if checkpoint_table and writers > 1:
+            raise ValueError(
+                "Checkpoints in kRAP commit with the batch on a single writer connection"
+            )
+
+        self.archive_directory = archive_directory
+        self.server = server
+        self.lookup_database = lookup_database
+        self.target_database = target_database
+        self.connection_factory = connection_factory
+        self.new_account_cache_size = new_account_cache_size
+        self.compress_archive = compress_archive
+        self.verify_archive = verify_archive
+        self.encoding = encoding
+        self.exporter = exporter
+        self.load_database = load_database
+        self.new_account_proc = new_account_proc
+
+        # Parser plugins, tried in order after those claiming the file name
+        if formats is None:
+            formats = default_formats(
+                index_list_reports or max_count_mismatch is not None
+            )
+        self.formats = formats
+        self.profiler = profiler
+        self.progress = progress
+
+        # Order each directory's files by size, age or name patterns, and
+        # estimate the run's makespan from past throughput
+        self.scheduler = FileScheduler(
+            schedule_order, priority_patterns, expected_workers, bytes_per_second
+        )
+        self.schedule = None
+
+        # Fail a List file, rolling back its rows, when the records loaded
+        # differ from its Record Count: trailer by more than this
+        self.max_count_mismatch = max_count_mismatch
+        self._hold_commit = False
+
+        # Quarantine bad records to a per-file reject file
+        self.rejects = RejectWriter(reject_directory) if reject_directory else None
+
+        # Look usp_IsNewAccount up against the best retained process date
+        self.process_dates = None
+        if resolve_process_date:
+            self.process_dates = ProcessDateResolver(retention_days)
+        self.checkpoints = Checkpoints(checkpoint_file)
+
+        # Share an inbox between several hosts: claim each file with a lease
+        # and keep checkpoints per file on the share
+        self.leases = None
+        if lease_directory:
+            self.leases = FileLeases(lease_directory, worker_id, lease_seconds)
+        if checkpoint_directory:
+            self.checkpoints = SharedCheckpoints(checkpoint_directory)
+
+        # Or keep them in kRAP, committed in the same transaction as each batch
+        if checkpoint_table and load_database:
+            self.checkpoints = DatabaseCheckpoints(
+                self._checkpoint_cursor, self._commit, checkpoint_table
+            )
+
+        self._conn = None
+        self._cursor = None
+        self._current_database = None
+
+        # Run usp_IsNewAccount lookups up to lookup_lookahead records ahead
+        # of the upserts, on a worker thread with its own ARCUSYM000
+        # connection, while this thread writes to kRAP
+        self.pipeline_lookups = pipeline_lookups and load_database
+        self.lookup_lookahead = lookup_lookahead
+        self._lookup_executor = None
+        self._lookup_seconds = 0.0
+        # Counted apart from the writer's retries, which size the batches
+        self.lookup_retries = 0
+        self._lookup_conn = None
+        self._lookup_cursor = None
+        self._new_account_cache = {}
+
+        # Answer usp_IsNewAccount locally from a SQLite index of account open
+        # dates, refreshed once per load_directory
+        self.account_index = None
+        if account_index_file and load_database:
+            self.account_index = AccountIndex(account_index_file)
+        self._account_index_refreshed = False
+
+        # Skip records identical to the row last loaded for their account,
+        # reference and card
+        self.fingerprints = None
+        if fingerprint_file and load_database:
+            self.fingerprints = FingerprintStore(
+                fingerprint_file, max_fingerprints, force_full_reload
+            )
+
+        # Upserts are sent batch_size rows at a time, committed and
+        # checkpointed per batch
+        self.batch_size = batch_size
+        self._batch = []
+
+        # Optionally let the batch size follow database latency between
+        # min_batch_size and max_batch_size
+        if not adaptive_batch_size:
+            min_batch_size = max_batch_size = batch_size
+        self.batch_sizer = AdaptiveBatchSize(
+            batch_size, min_batch_size, max_batch_size, target_batch_seconds
+        )
+
+        # Send upserts in CardTotals clustered key order so they touch pages
+        # sequentially.  Sorting a whole file spills sorted runs to disk past
+        # sort_memory_records, and the file is only checkpointed once loaded,
+        # as the committed rows are no longer a prefix of it.
+        self.sort_upserts = sort_upserts
+        self.sort_memory_records = sort_memory_records
+        self.sort_temp_directory = sort_temp_directory
+        self.writer = BatchUpsertWriter(
+            self._execute_upsert_batch,
+            self._connect,
+            self._rollback,
+            self._reconnect,
+            max_retries=max_retries,
+            backoff=retry_backoff,
+        )
+
+        # Spread each batch over several kRAP connections, partitioned by
+        # AccountNumber so no two writers upsert the same account
+        self.partitions = None
+        if writers > 1 and load_database:
+            self.partitions = PartitionedWriter(
+                writers,
+                connection_factory,
+                target_database,
+                server,
+                UPSERT_CARD_TOTALS_SQL,
+                max_retries=max_retries,
+                backoff=retry_backoff,
+            )
+
+        # Skip files whose content was already loaded under another name
+        self.duplicates = None
+        if duplicate_index_file:
+            self.duplicates = DuplicateDetector(duplicate_index_file, archive_directory)
+
+        # Archive on a worker thread, journaled next to the checkpoint file
+        self.archiver = None
+        if background_archive and archive_directory:
+            if archive_journal_file is None:
+                archive_journal_file = os.path.join(
+                    os.path.dirname(checkpoint_file), "archive_queue.jsonl"
+                )
+            self.archiver = BackgroundArchiver(
+                archive_journal_file, compress=compress_archive, verify=verify_archive
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self.exporter is not None:
+            self.exporter.close()
+        if self.rejects is not None:
+            self.rejects.close()
+        if self.archiver is not None:
+            self.archiver.close()
+            self.archiver = None
+        if self.progress is not None:
+            self.progress.close()
+        if self.duplicates is not None:
+            self.duplicates.close()
+            self.duplicates = None
+        if self._lookup_executor is not None:
+            self._lookup_executor.shutdown()
+            self._lookup_executor = None
+        self._close_lookup_connection()
+        if self.partitions is not None:
+            for index, (rows, seconds) in enumerate(self.partitions.throughput()):
+                logger.info(
+                    f"Writer {index + 1} upserted {rows} row(s) in {seconds:.1f}s ({_rate(rows, seconds):.0f} rows/s)"
+                )
+            self.partitions.close()
+            self.partitions = None
+        if self.fingerprints is not None:
+            self.fingerprints.prune()
+            self.fingerprints.close()
+            self.fingerprints = None
+        if self.account_index is not None:
+            logger.info(
+                f"Account index answered {self.account_index.hits} lookup(s), {self.account_index.misses} went to usp_IsNewAccount, {self.account_index.disagreements} of {self.account_index.checked} checked disagreed"
+            )
+            self.account_index.close()
+            self.account_index = None
+        self._close_connection()
+
+    def _close_connection(self):
+        if self._cursor is not None:
+            self._cursor.close()
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = None
+        self._cursor = None
+        self._current_database = None
+
+    def _close_lookup_connection(self):
+        try:
+            if self._lookup_conn is not None:
+                self._lookup_conn.close()
+        except Exception:
+            pass
+        self._lookup_conn = None
+        self._lookup_cursor = None
+
+    # The cursor for usp_IsNewAccount, on ARCUSYM000
+    def _lookup_connect(self):
+        if not self.pipeline_lookups:
+            cursor = self._connect()
+            self._use_database(cursor, self.lookup_database)
+            return cursor
+        if self._lookup_conn is None:
+            # Autocommit, so the lookups do not sit in an open implicit
+            # transaction holding their locks
+            self._lookup_conn = use_explicit_transactions(
+                self.connection_factory(self.lookup_database, self.server)
+            )
+            self._lookup_cursor = self._lookup_conn.cursor()
+        return self._lookup_cursor
+
+    # The cursor for the kRAP checkpoint table, on the upsert connection so a
+    # checkpoint commits with its batch
+    def _checkpoint_cursor(self):
+        cursor = self._connect()
+        self._use_database(cursor, self.target_database)
+        return cursor
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = use_explicit_transactions(
+                self.connection_factory(self.lookup_database, self.server)
+            )
+            self._cursor = self._conn.cursor()
+            self._cursor.fast_executemany = True
+            self._current_database = self.lookup_database
+        return self._cursor
+
+    def _rollback(self):
+        if self._conn is not None:
+            rollback_transaction(self._cursor)
+
+    # Replace a connection lost to a transient error
+    def _reconnect(self):
+        self._reset_connection()
+        self._connect()
+
+    def _use_database(self, cursor, database_name):
+        # Only switch databases when the session is not already on it
+        if self._current_database != database_name:
+            change_database(cursor, database_name)
+            self._current_database = database_name
+
+    # Bring the account index up to date before a run's first lookup
+    def _refresh_account_index(self):
+        if self.account_index is None or self._account_index_refreshed:
+            return
+        self._account_index_refreshed = True
+        try:
+            cursor = self._connect()
+            self._use_database(cursor, self.lookup_database)
+            self.account_index.refresh(cursor)
+        except Exception as e:
+            # usp_IsNewAccount still answers everything, only slower
+            logger.error(f"Error refreshing the account index: {e}")
+            self._reset_connection()
+
+    def load_directory(self, directory):
+        # Pick up accounts opened since the last run before its first lookup
+        self._account_index_refreshed = False
+
+        # Get all files in the directory
+        files_to_process = [
+            filename
+            for filename in os.listdir(directory)
+            if os.path.isfile(os.path.join(directory, filename))
+        ]
+
+        # Log if no files are found
+        if not files_to_process:
+            logger.info("No files found to process.")
+
+        started = time.perf_counter()
+        # Schedule the files still to load, fully processed ones are only
+        # reported as skipped
+        done = [
+            filename
+            for filename in files_to_process
+            if self.checkpoints.get(filename) == 0
+        ]
+        ordered, sizes = self.scheduler.order_files(
+            directory,
+            [filename for filename in files_to_process if filename not in done],
+        )
+        files_to_process = ordered + done
+        expected = self.scheduler.expected_makespan(sizes)
+        if expected is not None:
+            logger.info(
+                f"Scheduled {len(ordered)} file(s) {self.scheduler.order} first, expected makespan {expected:.1f}s on {self.scheduler.workers} worker(s)"
+            )
+
+        if self.progress is not None:
+            self.progress.start_run(len(ordered))
+        results = []
+        for filename in files_to_process:
+            # Skip files that have been fully processed (checkpoint value is 0)
+            if self.checkpoints.get(filename) == 0:
+                logger.info(f"Skipping file {filename} as it has been fully processed.")
+                results.append(FileStats(filename, status="skipped"))
+                continue
+            with self._profile(filename):
+                if self.leases is None:
+                    stats = self.load_file(os.path.join(directory, filename))
+                else:
+                    stats = self._load_leased_file(directory, filename)
+            if self.progress is not None:
+                self.progress.finish_file(stats)
+            results.append(stats)
+
+        self.schedule = ScheduleSummary(
+            self.scheduler.order,
+            len(ordered),
+            self.scheduler.workers,
+            expected,
+            time.perf_counter() - started,
+        )
+        return results
+
+    def _profile(self, filename):
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.profile(filename)
+
+    def _load_leased_file(self, directory, filename):
+        if not self.leases.acquire(filename):
+            logger.info(f"Skipping file {filename}, another worker holds its lease.")
+            return FileStats(filename, status="leased")
+        try:
+            # Another worker may have finished the file since it was listed
+            path = os.path.join(directory, filename)
+            if self.checkpoints.get(filename) == 0 or not os.path.exists(path):
+                logger.info(f"Skipping file {filename} as it has been fully processed.")
+                return FileStats(filename, status="skipped")
+            return self.load_file(path)
+        finally:
+            self.leases.release(filename)
+
+    def load_file(self, path):
+        filename = os.path.basename(path)
+        # Try the formats that expect this file name first
+        claimed = [
+            file_format for file_format in self.formats if file_format.claims(filename)
+        ]
+        formats = claimed + [
+            file_format for file_format in self.formats if file_format not in claimed
+        ]
+
+        started = time.perf_counter()
+        retries = self._writer_retries()
+        lookup_retries = self.lookup_retries
+        throughput = self._writer_throughput()
+        try:
+            file_size = os.path.getsize(path)
+
+            # Check for a copy of a file already loaded before any parsing
+            if self.duplicates is not None:
+                duplicate_of = self.duplicates.find(path)
+                if duplicate_of is not None:
+                    return self._skip_duplicate(path, duplicate_of, file_size, started)
+
+            if self.process_dates is not None:
+                self.process_dates.refresh()
+            if self.progress is not None:
+                self.progress.start_file(filename, content_size(path))
+        except Exception as e:
+            # A file that cannot even be sized, e.g. an empty or truncated
+            # archive, fails on its own without ending the run
+            logger.error(f"Error processing file {filename}: {e}")
+            return FileStats(
+                filename,
+                status="failed",
+                error=str(e),
+                elapsed=time.perf_counter() - started,
+            )
+        # A file with a checkpoint is being resumed
+        resume = bool(self.checkpoints.get(filename))
+        for file_format in formats:
+            stats = FileStats(filename, parser=file_format.name, file_size=file_size)
+            self._lookup_seconds = 0.0
+            try:
+                # Log the file being processed
+                logger.info(f"Processing file: {filename}")
+                if self.rejects is not None:
+                    self.rejects.open_file(filename, resume)
+                self._load_format(file_format, path, stats)
+                if self.exporter is not None:
+                    stats.records_exported = self.exporter.close_file()
+            except FormatError as e:
+                # The file does not look like this format, try the next one
+                logger.error(
+                    f"Error processing file {filename} using the {file_format.name} parser: {e}"
+                )
+                self._fail_file(stats, e)
+                continue
+            except Exception as e:
+                logger.error(
+                    f"Error processing file {filename} at line {stats.last_line}: {e}"
+                )
+                self._fail_file(stats, e)
+                break
+            finally:
+                if self.rejects is not None:
+                    self.rejects.close_file()
+                stats.db_seconds += self._lookup_seconds
+
+            logger.info(f"Processed file: {filename}")
+            if self.duplicates is not None:
+                self.duplicates.record(path)
+            self._archive(path)
+
+            # Remove the checkpoint entry for the processed file
+            self.checkpoints.update(filename, 0)
+            stats.status = "loaded"
+            break
+
+        stats.retries = self._writer_retries() - retries
+        stats.lookup_retries = self.lookup_retries - lookup_retries
+        stats.writer_rates = [
+            _rate(rows - rows_before, seconds - seconds_before)
+            for (rows, seconds), (rows_before, seconds_before) in zip(
+                self._writer_throughput(), throughput
+            )
+        ]
+        stats.elapsed = time.perf_counter() - started
+        return stats
+
+    def _skip_duplicate(self, path, duplicate_of, file_size, started):
+        filename = os.path.basename(path)
+        logger.warning(
+            f"Skipping file {filename} as it is a duplicate of {duplicate_of}."
+        )
+        self._archive(path)
+        self.checkpoints.update(filename, 0)
+        return FileStats(
+            filename,
+            status="duplicate",
+            file_size=file_size,
+            error=f"Duplicate of {duplicate_of}",
+            elapsed=time.perf_counter() - started,
+        )
+
+    def _fail_file(self, stats, error):
+        self._batch = []
+        if self.fingerprints is not None:
+            self.fingerprints.discard()
+        stats.status = "failed"
+        stats.error = str(error)
+        if self.exporter is not None:
+            self.exporter.abort_file()
+        self._reset_connection()
+        if self.partitions is not None:
+            self.partitions.reset()
+        self._close_lookup_connection()
+
+    def _reject(self, stats, line_number, offset, reason, text):
+        stats.records_rejected += 1
+        if self.rejects is not None:
+            self.rejects.reject(line_number, offset, reason, text)
+
+    def _reset_connection(self):
+        # Drop a connection that may be left mid-transaction so the next
+        # file starts on a fresh one
+        try:
+            if self._conn is not None:
+                rollback_transaction(self._cursor)
+        except Exception:
+            pass
+        try:
+            self._close_connection()
+        except Exception:
+            self._conn = None
+            self._cursor = None
+            self._current_database = None
+
+    def _archive(self, path):
+        if not self.archive_directory:
+            return
+        if self.archiver is not None:
+            # Hand the file to the background archiver and move on
+            self.archiver.submit(path, self.archive_directory)
+            return
+
+        # Move the processed file to the Archive directory
+        destination = archive_file(
+            path,
+            self.archive_directory,
+            compress=self.compress_archive,
+            verify=self.verify_archive,
+        )
+        logger.info(f"Moved file to archive: {destination}")
+
+    def _load_records(self, stats, records):
+        filename = stats.filename
+        if self.load_database:
+            self._refresh_account_index()
+            self._connect()
+
+        lookups = self._lookup_new_accounts(records)
+        try:
+            for record, new_acct, error in lookups:
+                stats.records_parsed += 1
+                stats.process_date = record.process_date
+                stats.last_line = max(stats.last_line, record.line_number)
+                self._load_record(filename, record, new_acct, error, stats)
+                # Renew as rows go by, not only per batch: a file whose rows
+                # are all unchanged, or only exported, never flushes one
+                if self.leases is not None:
+                    self.leases.keep_alive(filename)
+                if self.progress is not None:
+                    self.progress.update(record.offset, stats.records_loaded)
+        finally:
+            lookups.close()
+        self._flush_batch(stats)
+
+    # Yield (record, new_acct, error) for each record, in order.  Records
+    # without the key fields, or when only exporting, are not looked up.
+    def _lookup_new_accounts(self, records):
+        if not self.load_database:
+            for record in records:
+                yield record, None, None
+            return
+        if not self.pipeline_lookups:
+            for record in records:
+                if not _has_key_fields(record):
+                    yield record, None, None
+                    continue
+                new_acct, error = self._lookup(record)
+                yield record, new_acct, error
+            return
+
+        if self._lookup_executor is None:
+            self._lookup_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="card-totals-lookup"
+            )
+        pending = deque()
+        try:
+            for record in records:
+                future = None
+                if _has_key_fields(record):
+                    future = self._lookup_executor.submit(self._lookup, record)
+                pending.append((record, future))
+                if len(pending) > self.lookup_lookahead:
+                    yield self._lookup_result(*pending.popleft())
+            while pending:
+                yield self._lookup_result(*pending.popleft())
+        finally:
+            # Leave the lookup connection idle before the file moves on
+            for record, future in pending:
+                if future is not None:
+                    future.cancel()
+            wait([future for record, future in pending if future is not None])
+
+    def _lookup_result(self, record, future):
+        if future is None:
+            return record, None, None
+        new_acct, error = future.result()
+        return record, new_acct, error
+
+    def _lookup(self, record):
+        reconnect = None
+        if self.pipeline_lookups:
+            reconnect = self._close_lookup_connection
+        started = time.perf_counter()
+        try:
+            new_acct = self.writer.call_with_retry(
+                self._is_new_account,
+                record.acct_num,
+                record.process_date,
+                retry=not self._hold_commit,
+                reconnect=reconnect,
+                on_retry=self._count_lookup_retry,
+            )
+        except Exception as e:
+            return None, e
+        finally:
+            self._lookup_seconds += time.perf_counter() - started
+        return new_acct, None
+
+    # Pass records through, keeping the file's lease alive while they are read
+    def _keep_lease(self, records, filename):
+        for record in records:
+            self.leases.keep_alive(filename)
+            yield record
+
+    def _count_lookup_retry(self):
+        self.lookup_retries += 1
+
+    # The one load path every format goes through: lookup, batching, commit,
+    # checkpoint and reconciliation
+    def _load_format(self, file_format, path, stats):
+        start_line = file_format.start_line(
+            self.checkpoints.get(stats.filename), self.checkpoints.transactional
+        )
+        stats.start_line = start_line
+        if self.exporter is not None:
+            # A resumed file's export lacks the rows committed before
+            if start_line > 1:
+                logger.warning(
+                    f"Resuming {stats.filename} at line {start_line}, exporting the remaining rows as incomplete"
+                )
+            self.exporter.open_file(stats.filename, complete=start_line == 1)
+
+        def on_error(line_number, offset, reason, text):
+            logger.error(f"Error extracting values from line {line_number}: {reason}")
+            stats.parse_errors += 1
+            self._reject(stats, line_number, offset, reason, text)
+
+        records = _timed(
+            file_format.open(path, stats, start_line, self.encoding, on_error), stats
+        )
+        if self.sort_upserts == "file":
+            if self.leases is not None:
+                # Spilling a large file can outlast the lease
+                records = self._keep_lease(records, stats.filename)
+            records = sort_records(
+                records,
+                max_in_memory=self.sort_memory_records,
+                temp_directory=self.sort_temp_directory,
+            )
+
+        # Hold the whole file in one transaction when it may be failed on
+        # its record count
+        self._hold_commit = (
+            self.max_count_mismatch is not None
+            and self.load_database
+            and stats.trailer_count is not None
+            and start_line == 1
+        )
+        try:
+            self._load_records(stats, records)
+            self._reconcile(stats, start_line)
+            if self._hold_commit:
+                if self.leases is not None:
+                    self.leases.renew(stats.filename)
+                if self.checkpoints.transactional:
+                    self.checkpoints.stage(stats.filename, stats.last_line)
+                self._commit()
+                self._commit_fingerprints()
+                if not self.checkpoints.transactional:
+                    self.checkpoints.update(stats.filename, stats.last_line)
+        finally:
+            self._hold_commit = False
+
+    # Compare the records loaded with the List report's Record Count: trailer
+    def _reconcile(self, stats, start_line):
+        if stats.trailer_count is None:
+            return
+        if start_line > 1:
+            logger.warning(
+                f"Not reconciling {stats.filename} against its Record Count: trailer, it was resumed at line {start_line}"
+            )
+            return
+
+        if self.load_database:
+            accounted = stats.records_loaded + stats.records_unchanged
+        else:
+            accounted = stats.records_parsed - stats.records_skipped
+        stats.count_mismatch = stats.trailer_count - accounted
+        if stats.count_mismatch == 0:
+            return
+
+        message = (
+            f"Record count mismatch in {stats.filename}: trailer {stats.trailer_count}, "
+            f"parsed {stats.records_parsed}, parse errors {stats.parse_errors}, "
+            f"skipped {stats.records_skipped}, loaded {stats.records_loaded}, "
+            f"unchanged {stats.records_unchanged}"
+        )
+        if (
+            self.max_count_mismatch is not None
+            and abs(stats.count_mismatch) > self.max_count_mismatch
+        ):
+            raise ReconciliationError(message)
+        logger.warning(message)
+
+    def _load_record(self, filename, record, new_acct, error, stats):
+        # Skip if AccountNumber, ReferenceId, or CardNumber are null
+        if not _has_key_fields(record):
+            logger.warning(
+                f"Skipping line {record.line_number} in file {filename} due to missing AccountNumber, ReferenceId, or CardNumber."
+            )
+            stats.records_skipped += 1
+            self._reject(
+                stats,
+                record.line_number,
+                record.offset,
+                "Missing AccountNumber, ReferenceId, or CardNumber",
+                format_record(record),
+            )
+            return
+
+        if not self.load_database:
+            # Export only, NewAcct needs ARCUSYM000 so it is left empty
+            self.exporter.write(record)
+            return
+
+        if error is not None:
+            if is_transient_error(error):
+                raise error
+            logger.error(f"Error processing database operations: {error}")
+            stats.errors += 1
+            self._reject(
+                stats,
+                record.line_number,
+                record.offset,
+                f"Database error: {error}",
+                format_record(record),
+            )
+            return
+
+        # Log the parameters being passed to the stored procedure
+        logger.debug(
+            f"Parameters: ProcessDate={record.process_date}, AccountNumber={record.acct_num}, ReferenceId={record.ref_num}, CardNumber={record.card_num}, Name={record.name}, Address={record.address}, City={record.city}, ZIPCODE={record.zipcode}, DBA={record.dba}"
+        )
+        if self.fingerprints is not None and self.fingerprints.unchanged(
+            record, new_acct
+        ):
+            stats.records_unchanged += 1
+            if self.exporter is not None:
+                self.exporter.write(record, new_acct)
+            return
+
+        self._batch.append((record, new_acct))
+        if len(self._batch) >= self.batch_sizer.size:
+            self._flush_batch(stats)
+
+    # Upsert, commit and checkpoint the pending batch
+    def _flush_batch(self, stats):
+        if not self._batch:
+            return
+        batch = self._batch
+        self._batch = []
+        last_line = max(record.line_number for record, new_acct in batch)
+        if self.sort_upserts == "batch":
+            batch.sort(key=lambda item: upsert_key(item[0]))
+
+        rows = [
+            (
+                record.process_date,
+                record.acct_num,
+                record.ref_num,
+                new_acct,
+                record.card_num,
+                record.name,
+                record.address,
+                record.city,
+                record.zipcode,
+                record.dba,
+            )
+            for record, new_acct in batch
+        ]
+        writer = self.writer if self.partitions is None else self.partitions
+        retries = writer.retries
+        started = time.perf_counter()
+        rejected = dict(writer.write(rows, retry=not self._hold_commit))
+        stats.db_seconds += time.perf_counter() - started
+        stats.batches += 1
+        stats.batch_size_min = min(stats.batch_size_min or len(rows), len(rows))
+        stats.batch_size_max = max(stats.batch_size_max, len(rows))
+        stats.batch_size = self.batch_sizer.observe(
+            len(rows), time.perf_counter() - started, writer.retries - retries
+        )
+
+        for index, (record, new_acct) in enumerate(batch):
+            error = rejected.get(index)
+            if error is not None:
+                logger.error(f"Error processing database operations: {error}")
+                stats.errors += 1
+                self._reject(
+                    stats,
+                    record.line_number,
+                    record.offset,
+                    f"Database error: {error}",
+                    format_record(record),
+                )
+                continue
+            stats.records_loaded += 1
+            if self.fingerprints is not None:
+                self.fingerprints.stage(record, new_acct)
+            if self.exporter is not None:
+                self.exporter.write(record, new_acct)
+
+        # Make sure the lease is still ours before committing
+        if self.leases is not None:
+            self.leases.keep_alive(stats.filename)
+
+        if self._hold_commit:
+            return
+
+        # Commit the transaction after each batch, with its checkpoint when
+        # the checkpoints are kept in kRAP
+        checkpoint = self.sort_upserts != "file"
+        started = time.perf_counter()
+        if checkpoint and self.checkpoints.transactional:
+            self.checkpoints.stage(stats.filename, last_line)
+        self._commit()
+        stats.db_seconds += time.perf_counter() - started
+        self._commit_fingerprints()
+
+        # Update the checkpoint file after committing each batch
+        if checkpoint and not self.checkpoints.transactional:
+            self.checkpoints.update(stats.filename, last_line)
+
+    def _commit(self):
+        if self.partitions is not None:
+            self.partitions.commit()
+        else:
+            commit_transaction(self._connect())
+
+    def _writer_retries(self):
+        retries = self.writer.retries
+        if self.partitions is not None:
+            retries += self.partitions.retries
+        return retries
+
+    def _writer_throughput(self):
+        if self.partitions is None:
+            return []
+        return self.partitions.throughput()
+
+    def _commit_fingerprints(self):
+        if self.fingerprints is not None:
+            self.fingerprints.commit()
+
+    def _execute_upsert_batch(self, rows):
+        # Call the stored procedure to insert the values into the CardTotals table
+        cursor = self._connect()
+        self._use_database(cursor, self.target_database)
+        cursor.executemany(UPSERT_CARD_TOTALS_SQL, rows)
+
+    def _is_new_account(self, acct_num, process_date_int):
+        if self.process_dates is not None:
+            process_date_int = self.process_dates.best_process_date(process_date_int)
+        key = (acct_num, process_date_int)
+        new_acct = self._new_account_cache.get(key)
+        if new_acct is not None:
+            return new_acct
+
+        if self.account_index is not None:
+            new_acct = self.account_index.is_new(acct_num, process_date_int)
+            # Check a sample of the index's answers against the procedure
+            if new_acct is not None and self.account_index.needs_check():
+                expected = self._call_is_new_account(acct_num, process_date_int)
+                if not self.account_index.check(
+                    acct_num, process_date_int, new_acct, expected
+                ):
+                    # The unchecked answers cached so far are suspect too
+                    self._new_account_cache.clear()
+                new_acct = expected
+        if new_acct is None:
+            new_acct = self._call_is_new_account(acct_num, process_date_int)
+
+        if len(self._new_account_cache) >= self.new_account_cache_size:
+            self._new_account_cache.clear()
+        self._new_account_cache[key] = new_acct
+        return new_acct
+
+    def _call_is_new_account(self, acct_num, process_date_int):
+        # Execute stored procedure with OUTPUT parameter
+        cursor = self._lookup_connect()
+        if self.new_account_proc == "int":
+            result = cursor.execute(NEW_ACCOUNT_INT_SQL, acct_num).fetchone()
+        else:
+            cursor.execute(NEW_ACCOUNT_SQL, acct_num, process_date_int)
+
+            # Fetch the result
+            cursor.nextset()  # Move to the next result set
+            result = cursor.fetchone()
+
+        if result and result[0] == 1:
+            return "T"
+        return "F"
@@ -0,0 +1,58 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+LOG_FILENAME = "process_log.log"
+
+# The handlers added by configure_logging, so a process that runs several
+# loads replaces them instead of stacking up more
+_handlers = []
+
+
+# Configure logging to log to both a file and the console
+def configure_logging(log_directory, file_level=logging.DEBUG):
+    close_logging()
+
+    # Ensure the logs directory exists
+    os.makedirs(log_directory, exist_ok=True)
+
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG)  # Set to DEBUG to capture all log messages
+
+    # Create file handler
+    file_handler = logging.FileHandler(os.path.join(log_directory, LOG_FILENAME))
+    file_handler.setLevel(file_level)
+
+    # Create console handler
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.DEBUG)
+
+    # Create formatter and add it to the handlers
+    formatter = logging.Formatter("%(asctime)s:%(levelname)s:%(message)s")
+    file_handler.setFormatter(formatter)
+    console_handler.setFormatter(formatter)
+
+    # Add the handlers to the logger
+    logger.addHandler(file_handler)
+    logger.addHandler(console_handler)
+    _handlers.extend([file_handler, console_handler])
+    return logger
+
+
+# Remove and close the handlers added by configure_logging
+def close_logging():
+    logger = logging.getLogger()
+    while _handlers:
+        handler = _handlers.pop()
+        logger.removeHandler(handler)
+        handler.close()
+
+
+# Remove log files older than max_age_days
+def remove_old_log(log_directory, max_age_days=90):
+    log_file = os.path.join(log_directory, LOG_FILENAME)
+    if os.path.exists(log_file):
+        creation_time = datetime.fromtimestamp(os.path.getctime(log_file))
+        if datetime.now() - creation_time > timedelta(days=max_age_days):
+            os.remove(log_file)
+            logging.info(f"Removed log file: {log_file}")
@@ -0,0 +1,357 @@
+import codecs
+import locale
+import logging
+import os
+import re
+from collections import namedtuple
+from datetime import datetime
+
+from .fileio import open_source
+
+logger = logging.getLogger(__name__)
+
+
+# Raised when a file does not look like the format being parsed, e.g. no
+# header line or no process date where one is expected
+class FormatError(ValueError):
+    pass
+
+
+# One parsed card totals row, with the line number and byte offset of the
+# line it starts on in the (decompressed) source file
+CardRecord = namedtuple(
+    "CardRecord",
+    [
+        "process_date",
+        "acct_num",
+        "ref_num",
+        "card_num",
+        "name",
+        "address",
+        "city",
+        "zipcode",
+        "dba",
+        "line_number",
+        "offset",
+    ],
+)
+
+# Define the column indices (adjust these as needed)
+card_num_col_index = (21, 38)
+acct_num_col_index = (42, 52)
+name_col_index = (87, 140)
+address_col_index = (199, 250)
+city_col_index = (259, 277)
+zipcode_col_index = (277, 291)
+ref_num_col_index = (372, 390)
+dba_col_index = (550, 577)
+
+# The fixed-width columns in the order parse_fixed_width_line returns them
+fixed_width_columns = (
+    ref_num_col_index,
+    acct_num_col_index,
+    card_num_col_index,
+    name_col_index,
+    address_col_index,
+    city_col_index,
+    zipcode_col_index,
+    dba_col_index,
+)
+
+# Position of the MMDDYY process date on the header line of both formats
+process_date_col_index = (32, 39)
+
+# Regular expression to match lines that begin with a 6-digit number followed by 4 spaces and a two-digit number
+list_record_pattern = re.compile(r"^\d{6}\s{4}\d{2}")
+
+# Regular expression to extract values based on whitespace
+list_value_pattern = re.compile(r"(\S+(?:\s\S+)*)(?=\s{2,}|\s*$)")
+
+
+# Function to parse a fixed-width line, optionally with other columns in
+# the order of fixed_width_columns
+def parse_fixed_width_line(line, columns=None):
+    if columns is not None:
+        return tuple(line[start:end].strip() for start, end in columns)
+    ref_num = line[ref_num_col_index[0] : ref_num_col_index[1]].strip()
+    acct_num = line[acct_num_col_index[0] : acct_num_col_index[1]].strip()
+    card_num = line[card_num_col_index[0] : card_num_col_index[1]].strip()
+    name = line[name_col_index[0] : name_col_index[1]].strip()
+    address = line[address_col_index[0] : address_col_index[1]].strip()
+    city = line[city_col_index[0] : city_col_index[1]].strip()
+    zipcode = line[zipcode_col_index[0] : zipcode_col_index[1]].strip()
+    dba = line[dba_col_index[0] : dba_col_index[1]].strip()
+    return ref_num, acct_num, card_num, name, address, city, zipcode, dba
+
+
+# Parse a fixed-width line straight from its bytes, decoding only the used
+# columns.  Only valid for single-byte encodings, where byte offsets are
+# character offsets; the line ending falls outside the columns or is
+# stripped with the last one.
+def parse_fixed_width_bytes(raw, decode, columns=fixed_width_columns):
+    (
+        (ref_start, ref_end),
+        (acct_start, acct_end),
+        (card_start, card_end),
+        (name_start, name_end),
+        (address_start, address_end),
+        (city_start, city_end),
+        (zipcode_start, zipcode_end),
+        (dba_start, dba_end),
+    ) = columns
+    return (
+        decode(raw[ref_start:ref_end])[0].strip(),
+        decode(raw[acct_start:acct_end])[0].strip(),
+        decode(raw[card_start:card_end])[0].strip(),
+        decode(raw[name_start:name_end])[0].strip(),
+        decode(raw[address_start:address_end])[0].strip(),
+        decode(raw[city_start:city_end])[0].strip(),
+        decode(raw[zipcode_start:zipcode_end])[0].strip(),
+        decode(raw[dba_start:dba_end])[0].strip(),
+    )
+
+
+# The codecs decoder for encoding if it is single-byte, e.g. cp1252 or
+# latin-1, otherwise None
+def single_byte_decoder(encoding):
+    decode = codecs.getdecoder(encoding)
+    try:
+        if len(decode(b"\xc3\xa9", "replace")[0]) != 2:
+            return None  # UTF-8 and other multi-byte encodings
+        if len(decode(bytes(range(256)), "replace")[0]) != 256:
+            return None
+    except UnicodeError:
+        return None
+    return decode
+
+
+# Convert the MMDDYY process date found on a header line to a YYYYMMDD integer
+def parse_process_date(header_line):
+    process_date_str = header_line[
+        process_date_col_index[0] : process_date_col_index[1]
+    ].strip()
+    try:
+        return int(datetime.strptime(process_date_str, "%m%d%y").strftime("%Y%m%d"))
+    except ValueError as ve:
+        raise FormatError(
+            f"Error parsing process date from string '{process_date_str}': {ve}"
+        ) from ve
+
+
+# Page headers and blank lines that can split a List record across pages
+def is_list_filler_line(line):
+    return (
+        line.startswith("KEESLER FEDERAL CREDIT UNION")
+        or line.strip() == ""
+        or line.startswith("123456")
+        or line.startswith("-------------")
+    )
+
+
+# Function to parse the three combined lines of a List record
+def parse_list_record(combined_line):
+    # Extract values using the regular expression
+    values = list_value_pattern.findall(combined_line)
+    if len(values) < 11:
+        raise IndexError(f"Expected 11 values, got {len(values)}")
+
+    # Rename the extracted values to match the variables
+    if len(values[10]) > 4:
+        ref_num = values[len(values) - 1]
+    else:
+        ref_num = values[11]
+    acct_num = values[4].split(" ")[1]
+    card_num = values[3]
+    name = values[5]
+    address = values[6]
+    city = values[7]
+    zipcode = values[8]
+    dba = ""
+    return ref_num, acct_num, card_num, name, address, city, zipcode, dba
+
+
+class LineReader:
+    # Reads a binary file line by line, decoding each line, stripping its
+    # line ending and keeping the line number and byte offset of the line
+    # last returned.  Returns None at end of file instead of "".  Lines in
+    # skip_lines are passed over without being decoded, and stop_line (if
+    # given) is treated as the end of the file.
+
+    def __init__(self, file, encoding=None, skip_lines=frozenset(), stop_line=None):
+        self.file = file
+        self.encoding = encoding or locale.getpreferredencoding(False)
+        self.skip_lines = skip_lines
+        self.stop_line = stop_line
+        self.line_number = 0
+        self.offset = 0
+        self._next_offset = 0
+
+    def readline(self):
+        raw = self.readline_bytes()
+        if raw is None:
+            return None
+        return raw.decode(self.encoding).rstrip("\n\r")
+
+    # The next line as undecoded bytes, line ending included
+    def readline_bytes(self):
+        while True:
+            raw = self.file.readline()
+            if not raw:
+                return None
+            self.line_number += 1
+            self.offset = self._next_offset
+            self._next_offset += len(raw)
+            if self.line_number == self.stop_line:
+                return None
+            if self.line_number not in self.skip_lines:
+                return raw
+
+    # Read the next line that is not a page header or blank line
+    def read_content_line(self):
+        line = self.readline()
+        if self.skip_lines:
+            # Page headers and blank lines are already in skip_lines
+            return line
+        while line is not None and is_list_filler_line(line):
+            line = self.readline()
+        return line
+
+
+def _log_parse_error(line_number, offset, reason, text):
+    logger.error(f"Error extracting values from line {line_number}: {reason}")
+
+
+# Lazily yield a CardRecord for each data line of a fixed-width file,
+# starting at start_line.  With a single-byte encoding lines stay as bytes
+# and only the used columns are decoded.
+def iter_fixed_width_records(
+    path, start_line=1, encoding=None, on_error=None, columns=None
+):
+    with open_source(path, binary=True) as file:
+        reader = LineReader(file, encoding)
+
+        # The first line holds the process date
+        first_row = reader.readline()
+        if first_row is None:
+            raise FormatError("File is empty")
+        process_date = parse_process_date(first_row.strip())
+
+        decode = single_byte_decoder(reader.encoding)
+        while True:
+            if decode is not None:
+                raw = reader.readline_bytes()
+                if raw is None:
+                    return
+                if reader.line_number < start_line:
+                    continue
+                ref_num, acct_num, card_num, name, address, city, zipcode, dba = (
+                    parse_fixed_width_bytes(raw, decode, columns or fixed_width_columns)
+                )
+            else:
+                line = reader.readline()
+                if line is None:
+                    return
+                if reader.line_number < start_line:
+                    continue
+                ref_num, acct_num, card_num, name, address, city, zipcode, dba = (
+                    parse_fixed_width_line(line, columns)
+                )
+
+            yield CardRecord(
+                process_date,
+                acct_num,
+                ref_num,
+                card_num,
+                name,
+                address,
+                city,
+                zipcode,
+                dba,
+                reader.line_number,
+                reader.offset,
+            )
+
+
+# Lazily yield a CardRecord for each record of a List report, starting at
+# start_line.  Records that cannot be parsed are passed to on_error with
+# their line number, byte offset, reason and text.  With a ListReportIndex
+# from scan_list_report the header search is skipped and page headers are
+# passed over without being decoded or checked.
+def iter_list_records(path, start_line=1, encoding=None, on_error=None, index=None):
+    on_error = on_error or _log_parse_error
+    with open_source(path, binary=True) as file:
+        if index is not None:
+            reader = LineReader(file, encoding, index.skip_lines, index.trailer_line)
+            process_date = index.process_date
+            start_line = max(start_line, index.header_line + 1)
+        else:
+            reader = LineReader(file, encoding)
+
+            # Read until the HRKEESLER header for the process date
+            line = reader.readline()
+            while line is not None and not line.startswith("HRKEESLER"):
+                if line.startswith("Record Count:"):
+                    line = None
+                    break
+                line = reader.readline()
+            if line is None:
+                raise FormatError("No HRKEESLER header line found")
+            process_date = parse_process_date(line)
+
+        # Skip completed lines
+        while reader.line_number < start_line - 1:
+            if reader.readline() is None:
+                return
+
+        while True:
+            line1 = reader.readline()
+            if line1 is None or line1.startswith("Record Count:"):
+                return  # End of file or end of records
+
+            if not list_record_pattern.match(line1):
+                continue
+            line_number = reader.line_number
+            offset = reader.offset
+
+            line2 = reader.read_content_line()
+            if line2 is None:
+                return
+            if line2.endswith("  "):
+                line2 = line2[:-2]
+            line3 = reader.read_content_line()
+            if line3 is None:
+                return
+
+            combined_line = line1 + line2 + line3
+            try:
+                ref_num, acct_num, card_num, name, address, city, zipcode, dba = (
+                    parse_list_record(combined_line)
+                )
+            except IndexError as ie:
+                on_error(line_number, offset, str(ie), combined_line)
+                continue
+
+            yield CardRecord(
+                process_date,
+                acct_num,
+                ref_num,
+                card_num,
+                name,
+                address,
+                city,
+                zipcode,
+                dba,
+                line_number,
+                offset,
+            )
+
+
+def is_list_file(path):
+    return "list" in os.path.basename(path).lower()
+
+
+# Yield the CardRecords of an EFT file, choosing the parser from its name
+def iter_records(path, start_line=1, encoding=None, on_error=None):
+    if is_list_file(path):
+        return iter_list_records(path, start_line, encoding, on_error)
+    return iter_fixed_width_records(path, start_line, encoding, on_error)
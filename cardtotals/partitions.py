@@ -0,0 +1,170 @@
+import logging
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .db import commit_transaction, rollback_transaction, use_explicit_transactions
+from .writer import BatchUpsertWriter
+
+logger = logging.getLogger(__name__)
+
+
+# The writer an account's rows always go to.  crc32 rather than hash() so
+# the partitioning does not change from run to run.
+def partition_for(acct_num, partitions):
+    return zlib.crc32(str(acct_num).strip().encode()) % partitions
+
+
+class WriterPartition:
+    # One kRAP connection with its own BatchUpsertWriter, and the rows and
+    # time it has spent writing
+
+    def __init__(
+        self, index, connection_factory, database, server, execute_sql, **writer_options
+    ):
+        self.index = index
+        self.connection_factory = connection_factory
+        self.database = database
+        self.server = server
+        self.execute_sql = execute_sql
+        self.writer = BatchUpsertWriter(
+            self._execute_batch,
+            self._connect,
+            self.rollback,
+            self._reconnect,
+            **writer_options,
+        )
+        self.rows = 0
+        self.seconds = 0.0
+        self._conn = None
+        self._cursor = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = use_explicit_transactions(
+                self.connection_factory(self.database, self.server)
+            )
+            self._cursor = self._conn.cursor()
+            self._cursor.fast_executemany = True
+        return self._cursor
+
+    def _reconnect(self):
+        self.reset()
+        self._connect()
+
+    def _execute_batch(self, rows):
+        self._connect().executemany(self.execute_sql, rows)
+
+    def write(self, rows, retry=True):
+        started = time.perf_counter()
+        try:
+            return self.writer.write(rows, retry=retry)
+        finally:
+            self.rows += len(rows)
+            self.seconds += time.perf_counter() - started
+
+    def commit(self):
+        if self._conn is not None:
+            commit_transaction(self._cursor)
+
+    def rollback(self):
+        if self._conn is not None:
+            rollback_transaction(self._cursor)
+
+    # Drop a connection that may be left mid-transaction
+    def reset(self):
+        try:
+            self.rollback()
+        except Exception:
+            pass
+        self.close()
+
+    def close(self):
+        try:
+            if self._conn is not None:
+                self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+        self._cursor = None
+
+
+class PartitionedWriter:
+    # Writes each batch over several kRAP connections at once.  Rows are
+    # partitioned by a hash of AccountNumber, so every upsert for an account
+    # goes through the same connection and two writers never wait on, or
+    # deadlock over, each other's locks.  Throughput scales with the number
+    # of writers until the server becomes the bottleneck.
+    #
+    # Each writer commits its own transaction.  A batch is only checkpointed
+    # once every writer has committed, so a failure part way through means
+    # the whole batch is upserted again on the next run.
+
+    def __init__(
+        self,
+        writers,
+        connection_factory,
+        database,
+        server,
+        execute_sql,
+        **writer_options,
+    ):
+        self.partitions = [
+            WriterPartition(
+                index,
+                connection_factory,
+                database,
+                server,
+                execute_sql,
+                **writer_options,
+            )
+            for index in range(writers)
+        ]
+        self._executor = ThreadPoolExecutor(
+            max_workers=writers, thread_name_prefix="card-totals-writer"
+        )
+
+    @property
+    def retries(self):
+        return sum(partition.writer.retries for partition in self.partitions)
+
+    # Write rows across the writers, returning a list of (index, error)
+    # for the rejected rows as BatchUpsertWriter.write does
+    def write(self, rows, retry=True):
+        buckets = [[] for _ in self.partitions]
+        for index, row in enumerate(rows):
+            # AccountNumber is the second upsert parameter
+            buckets[partition_for(row[1], len(buckets))].append(index)
+
+        futures = {}
+        for partition, indexes in zip(self.partitions, buckets):
+            if indexes:
+                futures[partition.index] = self._executor.submit(
+                    partition.write, [rows[index] for index in indexes], retry
+                )
+        # Let every writer finish before raising, so none is left mid-batch
+        wait(futures.values())
+
+        rejected = []
+        for partition_index, future in futures.items():
+            indexes = buckets[partition_index]
+            for index, error in future.result():
+                rejected.append((indexes[index], error))
+        return rejected
+
+    def commit(self):
+        for partition in self.partitions:
+            partition.commit()
+
+    def reset(self):
+        for partition in self.partitions:
+            partition.reset()
+
+    # (rows, seconds) written by each writer so far
+    def throughput(self):
+        return [(partition.rows, partition.seconds) for partition in self.partitions]
+
+    def close(self):
+        self._executor.shutdown()
+        for partition in self.partitions:
+            partition.close()
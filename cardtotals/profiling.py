@@ -0,0 +1,132 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class _StackSampler:
+    # Samples the profiled thread's stack from a background thread, counting
+    # each distinct stack for a collapsed stack (flamegraph.pl, speedscope)
+    # file.  Sampling sees time spent waiting in ODBC calls as well, since
+    # pyodbc releases the GIL while the server works.
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="card-totals-sampler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                )
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class FileProfiler:
+    # Profiles the processing of one input file at a time with cProfile and,
+    # optionally, tracemalloc.  For each input it writes to output_directory:
+    #   <file>.<timestamp>.profile.txt  pstats sorted by cumulative and own time
+    #   <file>.<timestamp>.collapsed    sampled stacks for a flamegraph
+    #   <file>.<timestamp>.memory.txt   top allocation sites (trace_memory)
+
+    def __init__(
+        self, output_directory, trace_memory=False, sample_interval=0.005, limit=40
+    ):
+        self.output_directory = output_directory
+        self.trace_memory = trace_memory
+        self.sample_interval = sample_interval
+        self.limit = limit
+        os.makedirs(output_directory, exist_ok=True)
+
+    @contextmanager
+    def profile(self, name):
+        prefix = os.path.join(
+            self.output_directory,
+            f"{name}.{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        )
+        sampler = _StackSampler(threading.get_ident(), self.sample_interval)
+        profiler = cProfile.Profile()
+        if self.trace_memory:
+            tracemalloc.start()
+        sampler.start()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            sampler.stop()
+            snapshot = None
+            if self.trace_memory:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            try:
+                self._write_stats(profiler, prefix + ".profile.txt")
+                sampler.write(prefix + ".collapsed")
+                if snapshot is not None:
+                    self._write_memory(snapshot, peak, prefix + ".memory.txt")
+                logger.info(f"Wrote profile for {name} to {prefix}.*")
+            except Exception as e:
+                logger.error(f"Error writing profile for {name}: {e}")
+
+    def _write_stats(self, profiler, path):
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.strip_dirs()
+        for sort_key in ("cumulative", "tottime"):
+            output.write(f"Sorted by {sort_key}\n")
+            stats.sort_stats(sort_key).print_stats(self.limit)
+        with open(path, "w") as f:
+            f.write(output.getvalue())
+
+    def _write_memory(self, snapshot, peak, path):
+        with open(path, "w") as f:
+            f.write(f"Peak traced memory: {peak / 1024:.1f} KiB\n")
+            for stat in snapshot.statistics("lineno")[: self.limit]:
+                f.write(f"{stat}\n")
+
+
+# Add the --profile options to an entry point's argument parser
+def add_profile_arguments(parser):
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile each input file, writing stats and collapsed stacks to the logs directory",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="with --profile, also record the top allocation sites with tracemalloc",
+    )
@@ -0,0 +1,204 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+from datetime import datetime
+
+STATUS_FILENAME = "progress.json"
+
+# Status entries describing the file being loaded
+_FILE_KEYS = (
+    "file_size",
+    "bytes_read",
+    "percent",
+    "records_loaded",
+    "rows_per_second",
+    "eta_seconds",
+)
+
+
+def _timestamp(seconds):
+    return datetime.fromtimestamp(seconds).isoformat(sep=" ", timespec="seconds")
+
+
+class ProgressReporter:
+    # Heartbeat for long loads: every interval seconds while records flow it
+    # replaces status_file with a small JSON document giving the current
+    # file, bytes read of its size, records loaded, the current rows/s and an
+    # ETA for the file, and optionally rewrites a one-line console update.
+    # update() is called per record but only reads the clock until a write
+    # is due.  A scheduler can poll the file and treat a running load whose
+    # "updated" time stops moving as stalled, see python -m cardtotals.progress.
+
+    def __init__(self, status_file, interval=5.0, console=False, stream=None):
+        self.status_file = status_file
+        self.interval = interval
+        self.console = console
+        self.stream = stream or sys.stderr
+        self.started = time.time()
+        self.files_total = 0
+        self.files_done = 0
+        self._status = {}
+        self._file_started = None
+        self._start_bytes = None
+        self._last_write = 0.0
+        self._last_loaded = 0
+        directory = os.path.dirname(status_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def start_run(self, files_total):
+        self.files_total = files_total
+        self.files_done = 0
+        self._write(state="running", file=None)
+
+    def start_file(self, filename, file_size):
+        self._file_started = time.monotonic()
+        self._start_bytes = None
+        self._last_loaded = 0
+        self._last_write = self._file_started
+        self._write(
+            state="running",
+            file=filename,
+            file_size=file_size,
+            bytes_read=0,
+            percent=0.0,
+            records_loaded=0,
+            rows_per_second=0.0,
+            eta_seconds=None,
+        )
+
+    # Called for each record read; writes the status once interval is up
+    def update(self, bytes_read, records_loaded):
+        if self._start_bytes is None:
+            self._start_bytes = bytes_read
+        now = time.monotonic()
+        if now - self._last_write < self.interval:
+            return
+        file_size = self._status.get("file_size") or 0
+        rows_per_second = (records_loaded - self._last_loaded) / (
+            now - self._last_write
+        )
+
+        # Bytes per second since the file (or its resumed part) was started
+        eta_seconds = None
+        bytes_per_second = (bytes_read - self._start_bytes) / (now - self._file_started)
+        if bytes_per_second > 0 and file_size:
+            eta_seconds = max(0.0, (file_size - bytes_read) / bytes_per_second)
+
+        self._last_write = now
+        self._last_loaded = records_loaded
+        self._write(
+            bytes_read=bytes_read,
+            percent=100.0 * bytes_read / file_size if file_size else None,
+            records_loaded=records_loaded,
+            rows_per_second=rows_per_second,
+            eta_seconds=eta_seconds,
+        )
+
+    def finish_file(self, stats):
+        self.files_done += 1
+        if self.console:
+            self.stream.write("\n")
+            self.stream.flush()
+        for key in _FILE_KEYS:
+            self._status.pop(key, None)
+        self._write(
+            file=None,
+            last_file=stats.filename,
+            last_status=stats.status,
+            last_records_loaded=stats.records_loaded,
+        )
+
+    def close(self):
+        self._write(state="done", file=None)
+
+    def _write(self, **changes):
+        now = time.time()
+        self._status.update(changes)
+        self._status.update(
+            host=socket.gethostname(),
+            pid=os.getpid(),
+            started=_timestamp(self.started),
+            files_done=self.files_done,
+            files_total=self.files_total,
+            updated=_timestamp(now),
+            updated_epoch=now,
+        )
+        temp_path = f"{self.status_file}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(self._status, f, indent=1)
+            os.replace(temp_path, self.status_file)
+        except OSError:
+            # Progress is best effort, never fail a load over it
+            pass
+        if self.console and self._status.get("file"):
+            self.stream.write("\r" + format_status(self._status) + "\x1b[K")
+            self.stream.flush()
+
+
+def _format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+# One line summary of a status document
+def format_status(status):
+    if not status.get("file"):
+        return (
+            f"{status.get('state')}, {status.get('files_done')} of "
+            f"{status.get('files_total')} file(s), updated {status.get('updated')}"
+        )
+    percent = status.get("percent")
+    return (
+        f"{status['file']} ({status.get('files_done', 0) + 1}/{status.get('files_total')})"
+        f" {(status.get('bytes_read') or 0) / 1e6:,.1f}"
+        f" of {(status.get('file_size') or 0) / 1e6:,.1f} MB"
+        f" ({'-' if percent is None else f'{percent:.0f}'}%)"
+        f", loaded {status.get('records_loaded') or 0:,}"
+        f", {status.get('rows_per_second') or 0:,.0f} rows/s"
+        f", ETA {_format_seconds(status.get('eta_seconds'))}"
+    )
+
+
+# python -m cardtotals.progress [--status-file FILE] [--stale-seconds N]
+# Prints the status and exits 0 when running or done, 1 when a running load
+# has not updated for stale-seconds and 2 when there is no status file.
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show a card totals load's progress")
+    parser.add_argument(
+        "--status-file",
+        default=os.path.join("logs", STATUS_FILENAME),
+        help="progress status file (default: logs/progress.json)",
+    )
+    parser.add_argument(
+        "--stale-seconds",
+        type=float,
+        default=900,
+        help="report a running load as stalled after this long without an update",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.status_file, "r") as f:
+            status = json.load(f)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"No progress status at {args.status_file}: {e}")
+        return 2
+
+    print(format_status(status))
+    age = time.time() - status.get("updated_epoch", 0)
+    if status.get("state") == "running" and age > args.stale_seconds:
+        print(f"Stalled: no update for {_format_seconds(age)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
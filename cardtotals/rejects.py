@@ -0,0 +1,74 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+REJECT_COLUMNS = ["line_number", "offset", "reason", "record"]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+# Field values of a CardRecord as written to a reject file
+def format_record(record):
+    return "|".join(
+        [
+            str(record.process_date),
+            record.acct_num,
+            record.ref_num,
+            record.card_num,
+            record.name,
+            record.address,
+            record.city,
+            record.zipcode,
+            record.dba,
+        ]
+    )
+
+
+class RejectWriter:
+    # Quarantines records that could not be parsed or loaded into a
+    # tab-separated <source file>.rejects.tsv per source file, with the line
+    # number, byte offset and reason, so the rest of the file can carry on
+    # and only the rejects need to be looked at and re-submitted.  The file
+    # is only created once the first record is rejected.
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = None
+        self.rejected = 0
+        self._file = None
+
+    # Start the reject file for a source file.  A resumed file keeps adding
+    # to the rejects of its earlier run, a fresh one starts over.
+    def open_file(self, filename, resume=False):
+        self.close_file()
+        self.path = os.path.join(self.directory, filename + ".rejects.tsv")
+        self.rejected = 0
+        if not resume and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def reject(self, line_number, offset, reason, text):
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+            if self._file.tell() == 0:
+                self._file.write("\t".join(REJECT_COLUMNS) + "\n")
+        self._file.write(
+            "\t".join([str(line_number), str(offset), _escape(reason), _escape(text)])
+            + "\n"
+        )
+        self.rejected += 1
+
+    # Close the current file's reject file.  Returns the number of records
+    # rejected.
+    def close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            logger.warning(f"Wrote {self.rejected} rejected records to {self.path}")
+        return self.rejected
+
+    def close(self):
+        self.close_file()
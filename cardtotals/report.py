@@ -0,0 +1,54 @@
+# Plain text run report, one line per file processed, and the schedule's
+# makespan when given a ScheduleSummary
+def format_run_report(results, schedule=None):
+    lines = [f"Run report: {len(results)} file(s)"]
+    if schedule is not None and schedule.files:
+        line = f"Schedule: {schedule.files} file(s) {schedule.order} first"
+        if schedule.expected_makespan is not None:
+            line += (
+                f", expected makespan {schedule.expected_makespan:.1f}s"
+                f" on {schedule.workers} worker(s)"
+            )
+        line += f", actual {schedule.actual_makespan:.1f}s"
+        lines.append(line)
+    for stats in results:
+        line = (
+            f"{stats.filename}: {stats.status}"
+            f", parsed {stats.records_parsed}"
+            f", skipped {stats.records_skipped}"
+            f", parse errors {stats.parse_errors}"
+            f", loaded {stats.records_loaded}"
+            f", db errors {stats.errors}"
+        )
+        if stats.records_rejected:
+            line += f", rejected {stats.records_rejected}"
+        if stats.records_unchanged:
+            line += f", unchanged {stats.records_unchanged}"
+        if stats.batches:
+            line += (
+                f", batches {stats.batches}"
+                f" (size {stats.batch_size_min}-{stats.batch_size_max}"
+                f", next {stats.batch_size})"
+            )
+        if stats.lookup_retries:
+            line += f", lookup retries {stats.lookup_retries}"
+        if len(stats.writer_rates) > 1:
+            rates = "/".join(f"{rate:.0f}" for rate in stats.writer_rates)
+            line += f", writers {len(stats.writer_rates)} ({rates} rows/s)"
+        if stats.records_exported:
+            line += f", exported {stats.records_exported}"
+        if stats.trailer_count is not None:
+            line += f", trailer {stats.trailer_count}"
+            if stats.count_mismatch is not None:
+                line += f", mismatch {stats.count_mismatch}"
+        line += f", {stats.elapsed:.1f}s"
+        if stats.error:
+            line += f" ({stats.error})"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# Append the run report to a file, e.g. in the logs directory
+def write_run_report(results, report_file, schedule=None):
+    with open(report_file, "a") as f:
+        f.write(format_run_report(results, schedule) + "\n")
@@ -0,0 +1,83 @@
+import heapq
+import logging
+import os
+from collections import namedtuple
+from fnmatch import fnmatch
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_ORDERS = ("listing", "largest", "smallest", "oldest")
+
+# How a directory's files were scheduled: the order used, the number of
+# files and workers, and the expected (from past throughput, or None) and
+# actual seconds from the first file starting to the last one finishing
+ScheduleSummary = namedtuple(
+    "ScheduleSummary",
+    ["order", "files", "workers", "expected_makespan", "actual_makespan"],
+)
+
+
+# Seconds until the last of workers finishes when each takes the next
+# duration in order as soon as it is free
+def list_schedule_makespan(durations, workers=1):
+    finish_times = [0.0] * max(1, workers)
+    for duration in durations:
+        heapq.heapreplace(finish_times, finish_times[0] + duration)
+    return max(finish_times)
+
+
+class FileScheduler:
+    # Orders the files of a directory for loading.  "largest" puts the
+    # biggest files first, which keeps one large file starting last from
+    # holding up the end of the window when several workers or hosts share
+    # the inbox; "oldest" goes by modification time; "listing" keeps
+    # os.listdir order.  Files matching an earlier priority_patterns glob
+    # (e.g. "*List*") go before the others, in that order.
+
+    def __init__(
+        self, order="listing", priority_patterns=(), workers=1, bytes_per_second=None
+    ):
+        if order not in SCHEDULE_ORDERS:
+            raise ValueError(f"Unknown schedule order: {order}")
+        self.order = order
+        self.priority_patterns = list(priority_patterns)
+        self.workers = workers
+        self.bytes_per_second = bytes_per_second
+
+    def _priority(self, filename):
+        for index, pattern in enumerate(self.priority_patterns):
+            if fnmatch(filename.lower(), pattern.lower()):
+                return index
+        return len(self.priority_patterns)
+
+    # Returns the filenames in load order and their sizes in bytes
+    def order_files(self, directory, filenames):
+        sizes = {}
+        modified = {}
+        for filename in filenames:
+            try:
+                stat = os.stat(os.path.join(directory, filename))
+            except FileNotFoundError:
+                # Taken and archived by another host since the listing
+                stat = None
+            sizes[filename] = stat.st_size if stat else 0
+            modified[filename] = stat.st_mtime if stat else 0
+
+        ordered = list(filenames)
+        if self.order == "largest":
+            ordered.sort(key=lambda filename: -sizes[filename])
+        elif self.order == "smallest":
+            ordered.sort(key=lambda filename: sizes[filename])
+        elif self.order == "oldest":
+            ordered.sort(key=lambda filename: modified[filename])
+        ordered.sort(key=self._priority)
+        return ordered, [sizes[filename] for filename in ordered]
+
+    # Expected makespan of loading files of these sizes in order, or None
+    # without a throughput to go on
+    def expected_makespan(self, sizes):
+        if not self.bytes_per_second:
+            return None
+        return list_schedule_makespan(
+            [size / self.bytes_per_second for size in sizes], self.workers
+        )
@@ -0,0 +1,61 @@
+import heapq
+import os
+import pickle
+import tempfile
+
+
+# The CardTotals clustered key
+def upsert_key(record):
+    return (record.process_date, record.acct_num, record.ref_num)
+
+
+def _write_run(records, temp_directory):
+    fd, path = tempfile.mkstemp(
+        prefix="card_totals_", suffix=".run", dir=temp_directory
+    )
+    with os.fdopen(fd, "wb") as f:
+        for record in records:
+            pickle.dump(record, f, pickle.HIGHEST_PROTOCOL)
+    return path
+
+
+def _read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+# Yield records sorted by key.  Up to max_in_memory records are sorted in
+# memory; past that, sorted runs are spilled to temporary files and merged.
+def sort_records(records, key=upsert_key, max_in_memory=200_000, temp_directory=None):
+    runs = []
+    readers = []
+    try:
+        buffer = []
+        for record in records:
+            buffer.append(record)
+            if len(buffer) >= max_in_memory:
+                buffer.sort(key=key)
+                runs.append(_write_run(buffer, temp_directory))
+                buffer = []
+        buffer.sort(key=key)
+        if not runs:
+            yield from buffer
+            return
+        if buffer:
+            runs.append(_write_run(buffer, temp_directory))
+            buffer = []
+        readers = [_read_run(path) for path in runs]
+        yield from heapq.merge(*readers, key=key)
+    finally:
+        # Close the run files before removing them
+        for reader in readers:
+            reader.close()
+        for path in runs:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,141 @@
+import logging
+import time
+
+try:
+    import pyodbc
+except ImportError:  # Without pyodbc no error can be an ODBC error
+    pyodbc = None
+
+logger = logging.getLogger(__name__)
+
+# SQLSTATEs worth retrying: lost connections, timeouts and deadlocks
+TRANSIENT_SQLSTATES = {
+    "08001",  # Unable to establish connection
+    "08004",  # Server rejected the connection
+    "08S01",  # Communication link failure
+    "40001",  # Deadlock victim / serialization failure
+    "HYT00",  # Query timeout
+    "HYT01",  # Connection timeout
+}
+
+# Mark the start of an attempt so a failed one can be undone on its own,
+# without losing the rest of the open transaction.  The connection must be
+# in autocommit mode (see db.use_explicit_transactions), so the BEGIN opens
+# the only transaction rather than one nested in an implicit transaction.
+SAVEPOINT_SQL = """
+    IF @@TRANCOUNT = 0 BEGIN TRANSACTION;
+    SAVE TRANSACTION card_totals_batch;
+"""
+ROLLBACK_SAVEPOINT_SQL = "ROLLBACK TRANSACTION card_totals_batch"
+
+
+def is_transient_error(error):
+    if pyodbc is None:
+        return False
+    if isinstance(error, pyodbc.OperationalError):
+        return True
+    if isinstance(error, pyodbc.Error) and error.args:
+        return error.args[0] in TRANSIENT_SQLSTATES
+    return False
+
+
+class BatchUpsertWriter:
+    # Writes batches of upsert parameter rows with executemany.
+    #
+    # Transient ODBC errors roll back, reconnect and retry the whole batch
+    # with exponential backoff.  Data errors, e.g. a Name too long for the
+    # procedure parameter, roll back to a savepoint and split the batch in
+    # half, recursing until the failing rows are isolated, so a few bad rows
+    # cost O(log n) extra calls each instead of a row by row fallback.  The
+    # isolated rows are returned to the caller for the reject path.
+    #
+    # The writer never commits; the caller commits once write() returns.
+
+    def __init__(
+        self,
+        execute_batch,
+        get_cursor,
+        rollback,
+        reconnect,
+        max_retries=3,
+        backoff=0.5,
+        max_backoff=30.0,
+        sleep=time.sleep,
+    ):
+        self.execute_batch = execute_batch
+        self.get_cursor = get_cursor
+        self.rollback = rollback
+        self.reconnect = reconnect
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sleep = sleep
+
+        self.retries = 0
+        self.bisections = 0
+        self.batches = 0
+
+    # Write rows, returning a list of (index, error) for the rows that were
+    # rejected.  retry=False re-raises transient errors straight away, for
+    # callers whose open transaction holds more than this batch.
+    def write(self, rows, retry=True):
+        self.batches += 1
+        return self.call_with_retry(self._write_once, rows, retry=retry)
+
+    # Call func, reconnecting (with reconnect, if given, instead of the
+    # writer's own) and retrying with backoff on transient errors.  Retries
+    # are counted in self.retries, or by calling on_retry if given.
+    def call_with_retry(self, func, *args, retry=True, reconnect=None, on_retry=None):
+        attempt = 0
+        while True:
+            try:
+                return func(*args)
+            except Exception as e:
+                if not retry or not is_transient_error(e):
+                    raise
+                if attempt >= self.max_retries:
+                    raise
+                delay = min(self.backoff * 2**attempt, self.max_backoff)
+                attempt += 1
+                if on_retry is None:
+                    self.retries += 1
+                else:
+                    on_retry()
+                logger.warning(
+                    f"Transient database error, retrying in {delay:.1f}s "
+                    f"(attempt {attempt} of {self.max_retries}): {e}"
+                )
+                self.sleep(delay)
+                (reconnect or self.reconnect)()
+
+    def _write_once(self, rows):
+        rejected = []
+        self._attempt(rows, 0, len(rows), rejected)
+        return rejected
+
+    def _attempt(self, rows, start, end, rejected):
+        cursor = self.get_cursor()
+        cursor.execute(SAVEPOINT_SQL)
+        try:
+            self.execute_batch(rows[start:end])
+            return
+        except Exception as e:
+            if is_transient_error(e):
+                raise
+            error = e
+
+        try:
+            cursor.execute(ROLLBACK_SAVEPOINT_SQL)
+        except Exception:
+            # The error doomed the whole transaction, nothing to isolate
+            self.rollback()
+            raise error
+
+        if end - start == 1:
+            rejected.append((start, error))
+            return
+
+        self.bisections += 1
+        middle = (start + end) // 2
+        self._attempt(rows, start, middle, rejected)
+        self._attempt(rows, middle, end, rejected)
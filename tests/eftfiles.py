@@ -0,0 +1,89 @@
+from cardtotals.parsers import (
+    acct_num_col_index,
+    address_col_index,
+    card_num_col_index,
+    city_col_index,
+    dba_col_index,
+    name_col_index,
+    ref_num_col_index,
+    zipcode_col_index,
+)
+
+PAGE_HEADER = [
+    "KEESLER FEDERAL CREDIT UNION   PAGE {page}",
+    "",
+    "123456 header",
+    "-------------",
+]
+
+
+# A List report with records three lines each, a page break after
+# page_break_after records and a Record Count: trailer
+def list_report_lines(records=12, page_break_after=5, record_count=None):
+    lines = [
+        "KEESLER FEDERAL CREDIT UNION   PAGE 1",
+        "",
+        "HRKEESLER" + " " * 23 + "101926" + "  LIST REPORT",
+        "123456 header",
+        "-------------",
+        "",
+    ]
+    for i in range(records):
+        lines.append("%06d    10  CC  4000%012d  S %010d  " % (100000 + i, i, 1000 + i))
+        if i == page_break_after:
+            lines += [line.format(page=2) for line in PAGE_HEADER]
+        lines.append("JOHN DOE %d  %d MAIN ST  " % (i, i))
+        lines.append("  BILOXI  MS39530  X  REF%06d" % i)
+    lines.append(
+        "Record Count: %d" % (records if record_count is None else record_count)
+    )
+    return lines
+
+
+# A fixed-width record line with the values in their columns
+def fixed_width_line(card_num, acct_num, name, address, city, zipcode, ref_num, dba):
+    line = [" "] * 600
+    for (start, end), value in (
+        (card_num_col_index, card_num),
+        (acct_num_col_index, acct_num),
+        (name_col_index, name),
+        (address_col_index, address),
+        (city_col_index, city),
+        (zipcode_col_index, zipcode),
+        (ref_num_col_index, ref_num),
+        (dba_col_index, dba),
+    ):
+        line[start : start + len(value[: end - start])] = value[: end - start]
+    return "".join(line).rstrip()
+
+
+# The AccountNumber of record i in an EFT file from fixed_width_lines
+def account(i):
+    return "%010d" % (1000 + i)
+
+
+# A fixed-width EFT file for process date 2026-10-19 with one record per
+# line after the header, line i + 2 holding record i.  names can replace
+# the Name of some records.
+def fixed_width_lines(records=20, names=None):
+    lines = ["HDR" + " " * 29 + "101926"]
+    for i in range(records):
+        name = (names or {}).get(i, "JOHN DOE %d" % i)
+        lines.append(
+            fixed_width_line(
+                "4000%012d" % i,
+                account(i),
+                name,
+                "%d MAIN ST" % i,
+                "BILOXI",
+                "39530",
+                "REF%06d" % i,
+                "SHOP",
+            )
+        )
+    return lines
+
+
+def write_lines(path, lines):
+    path.write_text("\n".join(lines) + "\n")
+    return str(path)
@@ -0,0 +1,235 @@
+import threading
+
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None
+
+from cardtotals.db import COMMIT_SQL, ROLLBACK_SQL
+from cardtotals.writer import ROLLBACK_SAVEPOINT_SQL, SAVEPOINT_SQL
+
+# The driver's errors when it is installed.  Without it nothing is treated as
+# transient, so only the retry tests need the real classes.
+if pyodbc is not None:
+    DataError = pyodbc.DataError
+    OperationalError = pyodbc.OperationalError
+else:
+
+    class DataError(Exception):
+        pass
+
+    class OperationalError(Exception):
+        pass
+
+
+class FakeConnection:
+    # In-memory stand-in for a pyodbc connection to kRAP.  Upserted rows are
+    # pending until COMMIT_SQL and dropped by ROLLBACK_SQL or by rolling
+    # back to the batch savepoint.  Rows whose AccountNumber is in bad raise
+    # a DataError; the first transient_failures statements raise a
+    # communication link failure.
+
+    def __init__(self, bad=(), transient_failures=0):
+        self.bad = set(bad)
+        self.transient_failures = transient_failures
+        self.autocommit = False
+        self.pending = []
+        self.committed = []
+        self.savepoint = None
+        self.statements = 0
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.fast_executemany = False
+
+    def execute(self, sql, *params):
+        connection = self.connection
+        if sql == SAVEPOINT_SQL:
+            connection.savepoint = len(connection.pending)
+        elif sql == ROLLBACK_SAVEPOINT_SQL:
+            del connection.pending[connection.savepoint :]
+        elif sql == COMMIT_SQL:
+            connection.committed.extend(connection.pending)
+            connection.pending = []
+        elif sql == ROLLBACK_SQL:
+            connection.pending = []
+        return self
+
+    def executemany(self, sql, rows):
+        connection = self.connection
+        connection.statements += 1
+        if connection.transient_failures:
+            connection.transient_failures -= 1
+            raise OperationalError("08S01", "Communication link failure")
+        for row in rows:
+            if row[1] in connection.bad:
+                raise DataError("22001", f"String data, right truncation {row}")
+            connection.pending.append(row)
+
+
+# An upsert parameter row for AccountNumber acct_num
+def upsert_row(acct_num, ref_num="R1"):
+    return (
+        20261019,
+        acct_num,
+        ref_num,
+        "F",
+        "4000000000000000",
+        "JOHN DOE",
+        "1 MAIN ST",
+        "BILOXI",
+        "39530",
+        "SHOP",
+    )
+
+
+class FakeServer:
+    # In-memory stand-in for the SQL Server holding ARCUSYM000 and kRAP, for
+    # driving a CardTotalsLoader end to end.  connect() is a connection
+    # factory.  Each connection keeps its upserts and checkpoint writes in
+    # its own transaction until it commits.
+    #
+    # usp_IsNewAccount answers "T" for new_accounts.  Upserts of accounts in
+    # bad raise a DataError, the fail_commit'th commit carrying upserts
+    # fails as if the server went away and the first fail_lookups lookups
+    # time out.  open_dates and snapshot are the
+    # ARCUSYM000 account snapshot an AccountIndex refreshes from.
+
+    def __init__(self, new_accounts=(), bad=(), open_dates=None, snapshot=None):
+        self.new_accounts = set(new_accounts)
+        self.bad = set(bad)
+        self.open_dates = open_dates or {}
+        self.snapshot = snapshot
+        self.fail_commit = None
+        self.fail_lookups = 0
+        self.connections = []
+        # Committed upsert rows in the order they were sent, and the
+        # checkpoint table
+        self.upserts = []
+        self.checkpoints = {}
+        self.commits = 0
+        # (AccountNumber, ProcessDate, thread name) of each usp_IsNewAccount
+        self.lookups = []
+
+    def connect(self, database, server):
+        connection = ServerConnection(self, database)
+        self.connections.append(connection)
+        return connection
+
+    # Committed upserts per AccountNumber
+    def upsert_counts(self):
+        counts = {}
+        for row in self.upserts:
+            counts[row[1]] = counts.get(row[1], 0) + 1
+        return counts
+
+
+class ServerConnection:
+    def __init__(self, server, database):
+        self.server = server
+        self.database = database
+        self.autocommit = False
+        self.pending = []
+        self.savepoint = 0
+        self.closed = False
+
+    def cursor(self):
+        return ServerCursor(self)
+
+    def close(self):
+        self.pending = []
+        self.closed = True
+
+    def commit(self):
+        server = self.server
+        if any(kind == "upsert" for kind, value in self.pending):
+            server.commits += 1
+            if server.commits == server.fail_commit:
+                self.pending = []
+                raise RuntimeError("Server went away during commit")
+        for kind, value in self.pending:
+            if kind == "upsert":
+                server.upserts.append(value)
+            else:
+                filename, line_number = value
+                server.checkpoints[filename] = line_number
+        self.pending = []
+
+
+class ServerCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.fast_executemany = False
+        self._rows = []
+
+    def close(self):
+        pass
+
+    def execute(self, sql, *params):
+        connection = self.connection
+        server = connection.server
+        statement = " ".join(sql.split())
+        self._rows = []
+        if statement.startswith("USE "):
+            connection.database = statement[4:]
+        elif sql == SAVEPOINT_SQL:
+            connection.savepoint = len(connection.pending)
+        elif sql == ROLLBACK_SAVEPOINT_SQL:
+            del connection.pending[connection.savepoint :]
+        elif sql == COMMIT_SQL:
+            connection.commit()
+        elif sql == ROLLBACK_SQL:
+            connection.pending = []
+        elif "usp_IsNewAccount" in statement and server.fail_lookups:
+            server.fail_lookups -= 1
+            raise OperationalError("HYT00", "Query timeout expired")
+        elif "usp_IsNewAccount" in statement:
+            acct_num = params[0]
+            process_date = params[1] if len(params) > 1 else None
+            server.lookups.append(
+                (acct_num, process_date, threading.current_thread().name)
+            )
+            self._rows = [(1 if acct_num in server.new_accounts else 0,)]
+        elif statement.startswith("MERGE"):
+            filename, line_number = params[0], params[1]
+            connection.pending.append(("checkpoint", (filename, line_number)))
+        elif statement.startswith("SELECT LineNumber"):
+            line_number = server.checkpoints.get(params[0])
+            for kind, value in connection.pending:
+                if kind == "checkpoint" and value[0] == params[0]:
+                    line_number = value[1]
+            self._rows = [] if line_number is None else [(line_number,)]
+        elif statement.startswith("SELECT MAX(PROCESSDATE)"):
+            self._rows = [(server.snapshot,)]
+        elif statement.startswith("SELECT ACCOUNTNUMBER"):
+            self._rows = sorted(server.open_dates.items())
+        elif "CREATE TABLE" not in statement:
+            raise AssertionError(f"Unexpected statement: {statement}")
+        return self
+
+    def executemany(self, sql, rows):
+        connection = self.connection
+        assert connection.database == "kRAP", connection.database
+        for row in rows:
+            if row[1] in connection.server.bad:
+                raise DataError("22001", f"String data, right truncation {row}")
+            connection.pending.append(("upsert", row))
+
+    def nextset(self):
+        return True
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
@@ -0,0 +1,44 @@
+from datetime import date, datetime, timedelta
+
+from cardtotals.dates import (
+    ProcessDateResolver,
+    convert_date_to_int,
+    get_month_end,
+    month_end_int,
+)
+
+
+def _days(start, end):
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def test_month_end_int_matches_get_month_end():
+    for day in _days(date(2023, 1, 1), date(2028, 12, 31)):
+        int_date = convert_date_to_int(day)
+        assert month_end_int(int_date) == convert_date_to_int(get_month_end(int_date))
+
+
+def test_best_process_date_matches_the_datetime_comparison():
+    today = date(2026, 10, 19)
+    resolver = ProcessDateResolver(90, today=today)
+    cutoff = datetime.combine(today, datetime.min.time()) - timedelta(days=90)
+
+    # Precomputed and memoized dates alike
+    for day in _days(date(2020, 1, 1), date(2026, 12, 31)):
+        int_date = convert_date_to_int(day)
+        month_end = get_month_end(int_date)
+        expected = convert_date_to_int(month_end) if month_end <= cutoff else int_date
+        assert resolver.best_process_date(int_date) == expected
+
+
+def test_refresh_moves_the_cutoff_with_the_day():
+    resolver = ProcessDateResolver(90, today=date(2026, 10, 19))
+    assert resolver.best_process_date(20260731) == 20260731
+
+    resolver._fixed_today = date(2026, 11, 1)
+    resolver.refresh()
+    assert resolver.best_process_date(20260715) == 20260731
+    assert resolver.best_process_date(20260815) == 20260815
@@ -0,0 +1,58 @@
+import gzip
+import sqlite3
+
+from cardtotals.duplicates import DuplicateDetector, main
+from eftfiles import fixed_width_lines, write_lines
+
+
+def _full_hashes(index_file):
+    with sqlite3.connect(index_file) as db:
+        return [row[0] for row in db.execute("SELECT full_hash FROM loaded_files")]
+
+
+def test_finds_a_renamed_or_gzipped_copy(tmp_path):
+    loaded = write_lines(tmp_path / "EFT_20261019.txt", fixed_width_lines(20))
+    detector = DuplicateDetector(str(tmp_path / "index.sqlite"))
+    detector.record(loaded)
+
+    copy = tmp_path / "EFT_20261019_resent.txt.gz"
+    with open(loaded, "rb") as f:
+        copy.write_bytes(gzip.compress(f.read()))
+
+    assert detector.find(str(copy)) == "EFT_20261019.txt"
+    detector.close()
+
+
+def test_hashes_in_full_only_when_the_quick_hash_matches(tmp_path):
+    # Long enough for the quick hash to miss a change in the middle
+    lines = fixed_width_lines(400)
+    loaded = write_lines(tmp_path / "EFT_20261019.txt", lines)
+    index_file = str(tmp_path / "index.sqlite")
+    detector = DuplicateDetector(index_file)
+    detector.record(loaded)
+
+    shorter = write_lines(tmp_path / "EFT_short.txt", lines[:-1])
+    assert detector.find(shorter) is None
+    assert _full_hashes(index_file) == [None]
+
+    lines[200] = lines[200].replace("JOHN DOE 199", "JOHN DOX 199")
+    changed = write_lines(tmp_path / "EFT_changed.txt", lines)
+    assert detector.find(changed) is None
+    # The loaded file's full hash is kept for the next comparison
+    assert _full_hashes(index_file) != [None]
+    detector.close()
+
+
+def test_index_command_records_the_archive(tmp_path):
+    archive = tmp_path / "Archive"
+    archive.mkdir()
+    write_lines(archive / "EFT_20261018.txt", fixed_width_lines(5))
+    write_lines(archive / "EFT_20261019.txt", fixed_width_lines(6))
+    index_file = str(tmp_path / "index.sqlite")
+
+    main(["--index-file", index_file, "index", str(archive)])
+    assert len(_full_hashes(index_file)) == 2
+    # Files already indexed are left alone
+    detector = DuplicateDetector(index_file)
+    assert detector.index_directory(str(archive)) == 0
+    detector.close()
@@ -0,0 +1,69 @@
+import csv
+import os
+
+import pytest
+
+from cardtotals.export import RecordExporter, export_source
+from cardtotals.parsers import CardRecord
+
+
+def _record(acct_num, process_date=20261019):
+    return CardRecord(
+        process_date,
+        acct_num,
+        "REF000001",
+        "4000000000000001",
+        "JOHN DOE",
+        "1 MAIN ST",
+        "BILOXI",
+        "39530",
+        "SHOP",
+        2,
+        0,
+    )
+
+
+def _read(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_exports_each_process_date_under_its_partition(tmp_path):
+    exporter = RecordExporter(str(tmp_path), "csv")
+    exporter.open_file("EFT_20261019.txt.gz")
+    exporter.write(_record("0000001000"), "T")
+    exporter.write(_record("0000001001", 20261020), "F")
+
+    # Nothing is published until the file is done
+    path = str(tmp_path / "process_date=20261019" / "EFT_20261019.txt.csv")
+    assert not os.path.exists(path)
+    assert exporter.close_file() == 2
+
+    rows = _read(path)
+    assert rows[1][:4] == ["20261019", "0000001000", "REF000001", "T"]
+    assert export_source(path) == "EFT_20261019.txt.gz"
+    assert os.path.exists(tmp_path / "process_date=20261020" / "EFT_20261019.txt.csv")
+
+
+def test_another_files_export_is_never_replaced(tmp_path):
+    exporter = RecordExporter(str(tmp_path), "csv")
+    exporter.open_file("EFT_20261019.txt")
+    exporter.write(_record("0000001000"))
+    exporter.close_file()
+
+    exporter.open_file("EFT_20261019.txt.gz")
+    with pytest.raises(ValueError):
+        exporter.write(_record("0000001000"))
+    exporter.abort_file()
+
+
+def test_incomplete_export_is_kept_apart(tmp_path):
+    exporter = RecordExporter(str(tmp_path), "csv")
+    exporter.open_file("EFT_20261019.txt", complete=False)
+    exporter.write(_record("0000001000"))
+    exporter.close_file()
+
+    path = tmp_path / "_incomplete" / "process_date=20261019" / "EFT_20261019.txt.csv"
+    assert len(_read(path)) == 2
+    assert export_source(str(path)) is None
+    assert not os.path.exists(tmp_path / "process_date=20261019")
@@ -0,0 +1,63 @@
+import json
+import time
+
+import pytest
+
+from cardtotals.lease import FileLeases, LeaseLostError
+
+
+def test_only_one_worker_holds_a_lease(tmp_path):
+    first = FileLeases(str(tmp_path), "host-a:1")
+    second = FileLeases(str(tmp_path), "host-b:2")
+
+    assert first.acquire("EFT.txt")
+    assert not second.acquire("EFT.txt")
+    # Reacquiring your own lease renews it
+    assert first.acquire("EFT.txt")
+
+    first.release("EFT.txt")
+    assert second.acquire("EFT.txt")
+
+
+def test_expired_lease_is_broken_and_taken_over(tmp_path):
+    crashed = FileLeases(str(tmp_path), "host-a:1", lease_seconds=60)
+    assert crashed.acquire("EFT.txt")
+    lease_path = tmp_path / "EFT.txt.lease"
+    lease_path.write_text(json.dumps({"owner": "host-a:1", "expires": time.time() - 1}))
+
+    survivor = FileLeases(str(tmp_path), "host-b:2", lease_seconds=60)
+    assert survivor.acquire("EFT.txt")
+    assert json.loads(lease_path.read_text())["owner"] == "host-b:2"
+    assert [path.name for path in tmp_path.iterdir()] == ["EFT.txt.lease"]
+
+    # The crashed owner finds out when it next renews
+    with pytest.raises(LeaseLostError):
+        crashed.renew("EFT.txt")
+    # and its release leaves the new owner's lease alone
+    crashed.release("EFT.txt")
+    assert lease_path.exists()
+
+
+def test_torn_lease_expires_by_age(tmp_path):
+    lease_path = tmp_path / "EFT.txt.lease"
+    lease_path.write_text('{"owner": "host-a')
+    leases = FileLeases(str(tmp_path), "host-b:2", lease_seconds=3600)
+
+    assert not leases.acquire("EFT.txt")
+
+    leases.lease_seconds = 0
+    assert leases.acquire("EFT.txt")
+
+
+def test_keep_alive_renews_after_a_third_of_the_lease(tmp_path):
+    leases = FileLeases(str(tmp_path), "host-a:1", lease_seconds=30)
+    assert leases.acquire("EFT.txt")
+    lease_path = tmp_path / "EFT.txt.lease"
+    expires = json.loads(lease_path.read_text())["expires"]
+
+    leases.keep_alive("EFT.txt")
+    assert json.loads(lease_path.read_text())["expires"] == expires
+
+    leases._renewed["EFT.txt"] -= 11
+    leases.keep_alive("EFT.txt")
+    assert json.loads(lease_path.read_text())["expires"] > expires
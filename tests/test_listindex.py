@@ -0,0 +1,86 @@
+import gzip
+
+import pytest
+
+from cardtotals.formats import ListReportFormat
+from cardtotals.listindex import scan_list_report
+from cardtotals.parsers import iter_list_records
+from eftfiles import PAGE_HEADER, list_report_lines
+
+
+@pytest.fixture
+def report(tmp_path):
+    path = tmp_path / "CARD_List_1019.txt"
+    path.write_text("\n".join(list_report_lines()) + "\n")
+    return str(path)
+
+
+def test_scan_finds_header_page_breaks_and_trailer(report):
+    lines = list_report_lines()
+    index = scan_list_report(report)
+
+    assert index.header_line == 3
+    assert index.process_date == 20261019
+    assert index.page_breaks == [lines.index(PAGE_HEADER[0].format(page=2)) + 1]
+    assert index.trailer_line == len(lines)
+    assert index.record_count == 12
+    # Page headers and blank lines after the header are skipped, records not
+    for line_number in index.skip_lines:
+        assert not lines[line_number - 1].startswith("1000")
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 7, 64, 333, 1024 * 1024])
+def test_scan_is_the_same_for_any_block_size(report, block_size):
+    assert scan_list_report(report, block_size=block_size) == scan_list_report(report)
+
+
+def test_scan_reads_gzipped_reports(report, tmp_path):
+    gzipped = tmp_path / "CARD_List_1019.txt.gz"
+    with open(report, "rb") as source, gzip.open(gzipped, "wb") as target:
+        target.write(source.read())
+
+    assert scan_list_report(str(gzipped)) == scan_list_report(report)
+
+
+def test_scan_without_trailer(tmp_path):
+    path = tmp_path / "CARD_List_1019.txt"
+    path.write_text("\n".join(list_report_lines()[:-1]))
+
+    index = scan_list_report(str(path))
+
+    assert index.trailer_line is None
+    assert index.record_count is None
+
+
+def test_records_are_the_same_with_and_without_the_index(report):
+    with_index = list(iter_list_records(report, index=scan_list_report(report)))
+    without_index = list(iter_list_records(report))
+
+    assert with_index == without_index
+    assert [record.ref_num for record in with_index] == [
+        "REF%06d" % i for i in range(12)
+    ]
+
+
+@pytest.mark.parametrize("use_index", [True, False])
+def test_exact_resume_starts_after_the_checkpointed_record(report, use_index):
+    index = scan_list_report(report) if use_index else None
+    records = list(iter_list_records(report, index=index))
+    file_format = ListReportFormat()
+
+    for position, record in enumerate(records):
+        start_line = file_format.start_line(record.line_number, exact=True)
+        resumed = list(iter_list_records(report, start_line, index=index))
+        assert resumed == records[position + 1 :]
+
+
+def test_inexact_resume_backs_up_and_never_skips_a_record(report):
+    records = list(iter_list_records(report))
+    file_format = ListReportFormat(resume_lines=5)
+
+    for position, record in enumerate(records):
+        start_line = file_format.start_line(record.line_number)
+        resumed = list(iter_list_records(report, start_line))
+        # Whole records only, ending with everything from the checkpoint on
+        assert resumed == records[len(records) - len(resumed) :]
+        assert len(resumed) >= len(records) - position
@@ -0,0 +1,432 @@
+import os
+from datetime import date
+
+import pytest
+
+from cardtotals.checkpoint import read_checkpoint
+from cardtotals.dates import ProcessDateResolver
+from cardtotals.export import RecordExporter
+from cardtotals.loader import CardTotalsLoader
+from cardtotals.progress import ProgressReporter
+from cardtotals.writer import pyodbc
+from eftfiles import (
+    account,
+    fixed_width_line,
+    fixed_width_lines,
+    list_report_lines,
+    write_lines,
+)
+from fakedb import FakeServer
+
+
+@pytest.fixture
+def eft_file(tmp_path):
+    inbox = tmp_path / "in"
+    inbox.mkdir()
+    return write_lines(inbox / "EFT_20261019.txt", fixed_width_lines(20))
+
+
+def make_loader(tmp_path, server, **options):
+    options.setdefault("checkpoint_file", str(tmp_path / "checkpoint.txt"))
+    options.setdefault("batch_size", 5)
+    return CardTotalsLoader(connection_factory=server.connect, **options)
+
+
+def test_commits_and_checkpoints_each_batch(tmp_path, eft_file):
+    server = FakeServer(new_accounts={account(3)})
+
+    with make_loader(tmp_path, server) as loader:
+        stats = loader.load_file(eft_file)
+
+    assert stats.status == "loaded"
+    assert (stats.records_loaded, stats.batches) == (20, 4)
+    assert server.commits == 4
+    assert [row[1] for row in server.upserts] == [account(i) for i in range(20)]
+    assert [row[3] for row in server.upserts[:5]] == ["F", "F", "F", "T", "F"]
+    assert read_checkpoint(str(tmp_path / "checkpoint.txt")) == {"EFT_20261019.txt": 0}
+    # Upserts run in explicit transactions on an autocommit connection
+    assert all(connection.autocommit for connection in server.connections)
+
+
+def test_failed_commit_leaves_the_checkpoint_at_the_last_committed_batch(
+    tmp_path, eft_file
+):
+    server = FakeServer()
+    server.fail_commit = 3
+
+    with make_loader(tmp_path, server) as loader:
+        stats = loader.load_file(eft_file)
+
+    assert stats.status == "failed"
+    assert [row[1] for row in server.upserts] == [account(i) for i in range(10)]
+    # Record i is on line i + 2, so the second batch ends on line 11
+    checkpoint_file = str(tmp_path / "checkpoint.txt")
+    assert read_checkpoint(checkpoint_file) == {"EFT_20261019.txt": 11}
+
+    with make_loader(tmp_path, server) as loader:
+        stats = loader.load_file(eft_file)
+
+    assert stats.status == "loaded"
+    assert stats.start_line == 11
+    # A file checkpoint resumes at its own line, so that record is sent twice
+    counts = server.upsert_counts()
+    assert set(counts) == {account(i) for i in range(20)}
+    assert [acct for acct, count in counts.items() if count > 1] == [account(9)]
+    assert read_checkpoint(checkpoint_file) == {"EFT_20261019.txt": 0}
+
+
+def test_database_checkpoints_resume_exactly_once(tmp_path, eft_file):
+    server = FakeServer()
+    server.fail_commit = 3
+    table = "debit.CardTotalsCheckpoint"
+
+    with make_loader(tmp_path, server, checkpoint_table=table) as loader:
+        stats = loader.load_file(eft_file)
+
+    assert stats.status == "failed"
+    # The checkpoint committed with the second batch, the third's rolled back
+    assert server.checkpoints == {"EFT_20261019.txt": 11}
+
+    with make_loader(tmp_path, server, checkpoint_table=table) as loader:
+        stats = loader.load_file(eft_file)
+
+    assert stats.status == "loaded"
+    assert stats.start_line == 12
+    assert server.upsert_counts() == {account(i): 1 for i in range(20)}
+    assert server.checkpoints == {"EFT_20261019.txt": 0}
+
+
+def _list_report(tmp_path, record_count):
+    return write_lines(
+        tmp_path / "CARD_List_1019.txt",
+        list_report_lines(12, record_count=record_count),
+    )
+
+
+def test_list_report_matching_its_trailer_commits_once(tmp_path):
+    server = FakeServer()
+    path = _list_report(tmp_path, 12)
+
+    with make_loader(tmp_path, server, max_count_mismatch=0) as loader:
+        stats = loader.load_file(path)
+
+    assert stats.status == "loaded"
+    assert (stats.trailer_count, stats.count_mismatch) == (12, 0)
+    # The whole file is held in one transaction
+    assert stats.batches == 3
+    assert server.commits == 1
+    assert len(server.upserts) == 12
+
+
+def test_count_mismatch_rolls_the_held_file_back(tmp_path):
+    server = FakeServer()
+    path = _list_report(tmp_path, 13)
+
+    with make_loader(tmp_path, server, max_count_mismatch=0) as loader:
+        stats = loader.load_file(path)
+
+    assert stats.status == "failed"
+    assert "Record count mismatch" in stats.error
+    assert server.upserts == []
+    assert read_checkpoint(str(tmp_path / "checkpoint.txt")) == {}
+
+
+def test_count_mismatch_within_the_limit_is_only_reported(tmp_path):
+    server = FakeServer()
+    path = _list_report(tmp_path, 13)
+
+    with make_loader(tmp_path, server, max_count_mismatch=1) as loader:
+        stats = loader.load_file(path)
+
+    assert stats.status == "loaded"
+    assert stats.count_mismatch == 1
+    assert len(server.upserts) == 12
+
+
+def test_bad_rows_go_to_the_reject_file(tmp_path):
+    server = FakeServer(bad={account(4), account(12)})
+    lines = fixed_width_lines(20)
+    # A record without an AccountNumber, on line 22
+    lines.append(
+        fixed_width_line("4000999", "", "NO ACCOUNT", "", "", "", "REF999999", "")
+    )
+    path = write_lines(tmp_path / "EFT_20261019.txt", lines)
+    reject_directory = tmp_path / "rejects"
+
+    with make_loader(
+        tmp_path, server, reject_directory=str(reject_directory)
+    ) as loader:
+        stats = loader.load_file(path)
+
+    assert stats.status == "loaded"
+    assert (stats.records_loaded, stats.errors, stats.records_skipped) == (18, 2, 1)
+    assert stats.records_rejected == 3
+    assert len(server.upserts) == 18
+    rejects = (reject_directory / "EFT_20261019.txt.rejects.tsv").read_text()
+    rows = [line.split("\t") for line in rejects.splitlines()]
+    assert rows[0] == ["line_number", "offset", "reason", "record"]
+    assert [row[0] for row in rows[1:]] == ["6", "14", "22"]
+    assert rows[1][2].startswith("Database error")
+    assert rows[1][3].split("|")[1] == account(4)
+    assert rows[3][2] == "Missing AccountNumber, ReferenceId, or CardNumber"
+
+
+def test_pipelined_lookups_keep_file_order(tmp_path, eft_file):
+    server = FakeServer(new_accounts={account(3), account(17)})
+
+    with make_loader(
+        tmp_path, server, pipeline_lookups=True, lookup_lookahead=3
+    ) as loader:
+        stats = loader.load_file(eft_file)
+
+    assert stats.status == "loaded"
+    assert [row[1] for row in server.upserts] == [account(i) for i in range(20)]
+    assert [row[1] for row in server.upserts if row[3] == "T"] == [
+        account(3),
+        account(17),
+    ]
+    # Looked up on the lookup thread over its own ARCUSYM000 connection
+    assert [acct for acct, process_date, thread in server.lookups] == [
+        account(i) for i in range(20)
+    ]
+    assert all(
+        thread.startswith("card-totals-lookup") for acct, date, thread in server.lookups
+    )
+    assert [connection.database for connection in server.connections] == [
+        "kRAP",
+        "ARCUSYM000",
+    ]
+    assert all(connection.autocommit for connection in server.connections)
+
+
+def test_lookups_use_the_best_retained_process_date(tmp_path, eft_file):
+    server = FakeServer()
+
+    with make_loader(tmp_path, server, resolve_process_date=True) as loader:
+        # October's daily snapshots are past the 90 day retention by March
+        loader.process_dates = ProcessDateResolver(90, today=date(2027, 3, 1))
+        stats = loader.load_file(eft_file)
+
+    assert stats.status == "loaded"
+    assert {process_date for acct, process_date, thread in server.lookups} == {20261031}
+    # The rows keep the file's own process date
+    assert {row[0] for row in server.upserts} == {20261019}
+
+
+def test_fingerprints_skip_rows_already_loaded(tmp_path, eft_file):
+    server = FakeServer()
+    fingerprints = str(tmp_path / "fingerprints.sqlite")
+    changed = write_lines(
+        tmp_path / "EFT_20261019_2.txt",
+        fixed_width_lines(20, names={7: "JANE DOE 7"}),
+    )
+
+    with make_loader(tmp_path, server, fingerprint_file=fingerprints) as loader:
+        loader.load_file(eft_file)
+        stats = loader.load_file(changed)
+
+    assert stats.status == "loaded"
+    assert (stats.records_loaded, stats.records_unchanged) == (1, 19)
+    assert [row[5] for row in server.upserts[20:]] == ["JANE DOE 7"]
+
+    # A new NewAcct answer is a change too, and a full reload skips nothing
+    server.new_accounts.add(account(2))
+    with make_loader(tmp_path, server, fingerprint_file=fingerprints) as loader:
+        stats = loader.load_file(changed)
+    assert (stats.records_loaded, stats.records_unchanged) == (1, 19)
+    assert server.upserts[-1][1:4] == (account(2), "REF000002", "T")
+
+    with make_loader(
+        tmp_path, server, fingerprint_file=fingerprints, force_full_reload=True
+    ) as loader:
+        stats = loader.load_file(changed)
+    assert (stats.records_loaded, stats.records_unchanged) == (20, 0)
+
+
+def test_fingerprints_of_rolled_back_rows_are_not_kept(tmp_path, eft_file):
+    server = FakeServer()
+    server.fail_commit = 3
+    fingerprints = str(tmp_path / "fingerprints.sqlite")
+    copy = write_lines(tmp_path / "EFT_20261019_2.txt", fixed_width_lines(20))
+
+    with make_loader(tmp_path, server, fingerprint_file=fingerprints) as loader:
+        assert loader.load_file(eft_file).status == "failed"
+        stats = loader.load_file(copy)
+
+    assert (stats.records_loaded, stats.records_unchanged) == (10, 10)
+
+
+def test_duplicate_files_are_archived_without_loading(tmp_path, eft_file):
+    server = FakeServer()
+    archive = tmp_path / "Archive"
+    archive.mkdir()
+    copy = write_lines(
+        tmp_path / "in" / "EFT_20261019_resent.txt", fixed_width_lines(20)
+    )
+
+    with make_loader(
+        tmp_path,
+        server,
+        archive_directory=str(archive),
+        duplicate_index_file=str(tmp_path / "duplicates.sqlite"),
+    ) as loader:
+        loader.load_file(eft_file)
+        stats = loader.load_file(copy)
+
+    assert stats.status == "duplicate"
+    assert stats.error == "Duplicate of EFT_20261019.txt"
+    assert len(server.upserts) == 20
+    assert sorted(path.name for path in archive.iterdir()) == [
+        "EFT_20261019.txt",
+        "EFT_20261019_resent.txt",
+    ]
+
+
+def test_unreadable_file_fails_without_ending_the_run(tmp_path, eft_file):
+    server = FakeServer()
+    inbox = tmp_path / "in"
+    # An empty gzip file has no size trailer to read
+    (inbox / "EFT_b.txt.gz").write_bytes(b"")
+    progress = ProgressReporter(str(tmp_path / "progress.json"))
+
+    with make_loader(
+        tmp_path,
+        server,
+        duplicate_index_file=str(tmp_path / "duplicates.sqlite"),
+        progress=progress,
+        schedule_order="largest",
+    ) as loader:
+        results = loader.load_directory(str(inbox))
+
+    assert [(stats.filename, stats.status) for stats in results] == [
+        ("EFT_20261019.txt", "loaded"),
+        ("EFT_b.txt.gz", "failed"),
+    ]
+    assert len(server.upserts) == 20
+    assert read_checkpoint(str(tmp_path / "checkpoint.txt")) == {"EFT_20261019.txt": 0}
+
+
+def _count_renewals(loader):
+    renewals = []
+    renew = loader.leases.renew
+
+    def counting_renew(filename):
+        renewals.append(filename)
+        renew(filename)
+
+    loader.leases.renew = counting_renew
+    return renewals
+
+
+@pytest.mark.parametrize("sort_upserts", [None, "file"])
+def test_lease_is_renewed_while_no_batches_are_written(
+    tmp_path, eft_file, sort_upserts
+):
+    server = FakeServer()
+    fingerprints = str(tmp_path / "fingerprints.sqlite")
+    options = dict(
+        fingerprint_file=fingerprints,
+        lease_directory=str(tmp_path / "leases"),
+        checkpoint_directory=str(tmp_path / "checkpoints"),
+        sort_upserts=sort_upserts,
+        sort_memory_records=5,
+        sort_temp_directory=str(tmp_path),
+    )
+    with make_loader(tmp_path, server, **options) as loader:
+        loader.load_directory(os.path.dirname(eft_file))
+
+    # Every row is unchanged the second time, so no batch is flushed
+    copy_directory = tmp_path / "copy"
+    copy_directory.mkdir()
+    write_lines(copy_directory / "EFT_20261019_2.txt", fixed_width_lines(20))
+    with make_loader(tmp_path, server, **options) as loader:
+        loader.leases.lease_seconds = 0
+        renewals = _count_renewals(loader)
+        (stats,) = loader.load_directory(str(copy_directory))
+
+    assert (stats.status, stats.batches, stats.records_unchanged) == ("loaded", 0, 20)
+    # Renewed for each record read, and again as each is loaded when sorting
+    expected = 40 if sort_upserts == "file" else 20
+    assert renewals == ["EFT_20261019_2.txt"] * expected
+
+
+def test_disabled_account_index_answers_are_not_served_from_the_cache(
+    tmp_path, eft_file
+):
+    # The index says the first accounts are new, usp_IsNewAccount disagrees
+    server = FakeServer(
+        open_dates={account(i): 20261005 for i in range(5)}, snapshot=20261031
+    )
+    copy = write_lines(tmp_path / "EFT_20261019_2.txt", fixed_width_lines(20))
+
+    with make_loader(
+        tmp_path, server, account_index_file=str(tmp_path / "accounts.sqlite")
+    ) as loader:
+        # Leave the first two answers unchecked, check the third
+        loader.account_index.verify_first = 0
+        loader.account_index.verify_every = 3
+        loader.load_file(eft_file)
+        assert loader.account_index.disabled
+        loader.load_file(copy)
+
+    assert [row[3] for row in server.upserts[:3]] == ["T", "T", "F"]
+    assert {row[3] for row in server.upserts[20:]} == {"F"}
+
+
+def test_account_index_is_refreshed_for_each_directory(tmp_path, eft_file):
+    server = FakeServer(open_dates={account(0): 20261005}, snapshot=20261018)
+    next_inbox = tmp_path / "next"
+    next_inbox.mkdir()
+    write_lines(next_inbox / "EFT_20261019_2.txt", fixed_width_lines(20))
+
+    with make_loader(
+        tmp_path, server, account_index_file=str(tmp_path / "accounts.sqlite")
+    ) as loader:
+        loader.load_directory(os.path.dirname(eft_file))
+        assert loader.account_index.refreshed_through == 20261018
+        server.snapshot = 20261019
+        loader.load_directory(str(next_inbox))
+        assert loader.account_index.refreshed_through == 20261019
+
+
+def test_resumed_file_is_exported_as_incomplete(tmp_path, eft_file):
+    server = FakeServer()
+    server.fail_commit = 3
+    exports = str(tmp_path / "exports")
+
+    with make_loader(
+        tmp_path, server, exporter=RecordExporter(exports, "csv")
+    ) as loader:
+        assert loader.load_file(eft_file).status == "failed"
+    with make_loader(
+        tmp_path, server, exporter=RecordExporter(exports, "csv")
+    ) as loader:
+        stats = loader.load_file(eft_file)
+
+    # Lines 11 to 21, after the checkpoint
+    assert (stats.status, stats.records_exported) == ("loaded", 11)
+    assert os.listdir(os.path.join(exports, "process_date=20261019")) == []
+    path = os.path.join(
+        exports, "_incomplete", "process_date=20261019", "EFT_20261019.txt.csv"
+    )
+    with open(path) as f:
+        assert len(f.read().splitlines()) == 12
+
+
+@pytest.mark.skipif(pyodbc is None, reason="transient errors are pyodbc errors")
+@pytest.mark.parametrize("pipeline_lookups", [False, True])
+def test_lookup_retries_are_not_counted_as_write_retries(
+    tmp_path, eft_file, pipeline_lookups
+):
+    server = FakeServer()
+    server.fail_lookups = 2
+
+    with make_loader(
+        tmp_path, server, retry_backoff=0, pipeline_lookups=pipeline_lookups
+    ) as loader:
+        stats = loader.load_file(eft_file)
+        assert loader.writer.retries == 0
+
+    assert stats.status == "loaded"
+    assert (stats.retries, stats.lookup_retries) == (0, 2)
+    assert len(server.upserts) == 20
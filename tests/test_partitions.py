@@ -0,0 +1,65 @@
+from cardtotals.partitions import PartitionedWriter, partition_for
+from fakedb import FakeConnection, upsert_row
+
+UPSERT_SQL = "EXEC debit.usp_UpsertCardTotals"
+
+
+class ConnectionFactory:
+    def __init__(self, bad=()):
+        self.bad = bad
+        self.connections = []
+
+    def __call__(self, database, server):
+        connection = FakeConnection(self.bad)
+        self.connections.append(connection)
+        return connection
+
+
+def test_partition_for_is_stable_and_in_range():
+    for partitions in (1, 2, 4, 7):
+        for acct_num in ("0000001000", "0000001001", "42"):
+            partition = partition_for(acct_num, partitions)
+            assert 0 <= partition < partitions
+            assert partition == partition_for(acct_num, partitions)
+
+
+def test_partitioned_write_maps_rejects_back_to_the_batch():
+    rows = [upsert_row(f"{i % 13:010d}", f"R{i}") for i in range(60)]
+    bad = {f"{3:010d}", f"{8:010d}"}
+    factory = ConnectionFactory(bad)
+    writer = PartitionedWriter(4, factory, "kRAP", "server", UPSERT_SQL)
+    try:
+        rejected = writer.write(rows)
+        writer.commit()
+    finally:
+        writer.close()
+
+    assert sorted(index for index, error in rejected) == [
+        index for index, row in enumerate(rows) if row[1] in bad
+    ]
+    committed = [
+        row for connection in factory.connections for row in connection.committed
+    ]
+    assert sorted(committed) == sorted(row for row in rows if row[1] not in bad)
+    assert all(connection.autocommit for connection in factory.connections)
+
+
+def test_partitioned_write_keeps_each_account_on_one_writer():
+    rows = [upsert_row(f"{i % 17:010d}", f"R{i}") for i in range(100)]
+    factory = ConnectionFactory()
+    writer = PartitionedWriter(4, factory, "kRAP", "server", UPSERT_SQL)
+    try:
+        writer.write(rows)
+        writer.write(list(reversed(rows)))
+        writer.commit()
+        throughput = writer.throughput()
+    finally:
+        writer.close()
+
+    owners = {}
+    for index, connection in enumerate(factory.connections):
+        for row in connection.committed:
+            owners.setdefault(row[1], set()).add(index)
+    assert len(owners) == 17
+    assert all(len(indexes) == 1 for indexes in owners.values())
+    assert sum(rows_written for rows_written, seconds in throughput) == 200
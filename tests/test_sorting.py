@@ -0,0 +1,84 @@
+import random
+
+
+import cardtotals.sorting as sorting
+from cardtotals.parsers import CardRecord
+from cardtotals.sorting import sort_records, upsert_key
+
+
+def _records(count, seed=1):
+    generator = random.Random(seed)
+    records = []
+    for line_number in range(1, count + 1):
+        records.append(
+            CardRecord(
+                generator.choice([20261018, 20261019]),
+                f"{generator.randrange(1000):010d}",
+                f"REF{line_number:06d}",
+                "4000000000000000",
+                "JOHN DOE",
+                "1 MAIN ST",
+                "BILOXI",
+                "39530",
+                "SHOP",
+                line_number,
+                line_number * 100,
+            )
+        )
+    return records
+
+
+def test_sorts_in_memory(tmp_path):
+    records = _records(50)
+
+    result = list(sort_records(records, temp_directory=tmp_path))
+
+    assert result == sorted(records, key=upsert_key)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_spills_and_merges_runs(tmp_path, monkeypatch):
+    records = _records(103)
+    runs = []
+    write_run = sorting._write_run
+
+    def counting_write_run(run, temp_directory):
+        path = write_run(run, temp_directory)
+        runs.append(path)
+        return path
+
+    monkeypatch.setattr(sorting, "_write_run", counting_write_run)
+
+    result = list(sort_records(records, max_in_memory=10, temp_directory=tmp_path))
+
+    assert result == sorted(records, key=upsert_key)
+    assert len(runs) == 11
+    # The run files are removed once merged
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_removes_runs_when_abandoned(tmp_path):
+    records = _records(40)
+    sorted_records = sort_records(records, max_in_memory=8, temp_directory=tmp_path)
+
+    first = next(sorted_records)
+    assert first == min(records, key=upsert_key)
+    assert list(tmp_path.iterdir()) != []
+
+    sorted_records.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_sorts_by_a_given_key(tmp_path):
+    records = _records(30)
+
+    result = list(
+        sort_records(
+            records,
+            key=lambda record: -record.line_number,
+            max_in_memory=7,
+            temp_directory=tmp_path,
+        )
+    )
+
+    assert [record.line_number for record in result] == list(range(30, 0, -1))
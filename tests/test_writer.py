@@ -0,0 +1,155 @@
+import pytest
+
+from cardtotals.db import rollback_transaction
+from cardtotals.writer import BatchUpsertWriter, is_transient_error, pyodbc
+from fakedb import DataError, FakeConnection, upsert_row
+
+needs_pyodbc = pytest.mark.skipif(
+    pyodbc is None, reason="transient errors are pyodbc errors"
+)
+
+UPSERT_SQL = "EXEC debit.usp_UpsertCardTotals"
+
+
+class WriterHarness:
+    # A BatchUpsertWriter over one FakeConnection, replaced on reconnect as
+    # the loader's connection is
+
+    def __init__(self, bad=(), transient_failures=0, max_retries=3):
+        self.bad = bad
+        self.transient_failures = transient_failures
+        self.reconnects = 0
+        self.connection = FakeConnection(bad, transient_failures)
+        self.cursor = self.connection.cursor()
+        self.writer = BatchUpsertWriter(
+            lambda rows: self.cursor.executemany(UPSERT_SQL, rows),
+            lambda: self.cursor,
+            lambda: rollback_transaction(self.cursor),
+            self.reconnect,
+            max_retries=max_retries,
+            sleep=lambda seconds: None,
+        )
+
+    def reconnect(self):
+        self.reconnects += 1
+        failures = self.connection.transient_failures
+        self.connection = FakeConnection(self.bad, failures)
+        self.cursor = self.connection.cursor()
+
+
+def _accounts(rows):
+    return [row[1] for row in rows]
+
+
+def test_write_sends_a_clean_batch_in_one_statement():
+    harness = WriterHarness()
+    rows = [upsert_row(f"{i:010d}") for i in range(10)]
+
+    assert harness.writer.write(rows) == []
+    assert harness.connection.pending == rows
+    assert harness.connection.statements == 1
+    assert harness.writer.bisections == 0
+
+
+def test_bisection_isolates_failing_rows():
+    rows = [upsert_row(f"{i:010d}") for i in range(16)]
+    harness = WriterHarness(bad={rows[3][1], rows[10][1]})
+
+    rejected = harness.writer.write(rows)
+
+    assert [index for index, error in rejected] == [3, 10]
+    assert all(isinstance(error, DataError) for index, error in rejected)
+    # Everything else is left in the open transaction, in order
+    assert harness.connection.pending == [
+        row for index, row in enumerate(rows) if index not in (3, 10)
+    ]
+    # Each bad row costs O(log n) statements, not one per row
+    assert harness.connection.statements < len(rows)
+
+
+def test_every_row_failing_rejects_every_row():
+    rows = [upsert_row(f"{i:010d}") for i in range(5)]
+    harness = WriterHarness(bad=set(_accounts(rows)))
+
+    rejected = harness.writer.write(rows)
+
+    assert [index for index, error in rejected] == [0, 1, 2, 3, 4]
+    assert harness.connection.pending == []
+
+
+@needs_pyodbc
+def test_transient_error_reconnects_and_retries_the_batch():
+    harness = WriterHarness(transient_failures=2)
+    rows = [upsert_row(f"{i:010d}") for i in range(4)]
+
+    assert harness.writer.write(rows) == []
+    assert harness.writer.retries == 2
+    assert harness.reconnects == 2
+    assert harness.connection.pending == rows
+
+
+@needs_pyodbc
+def test_transient_error_is_raised_without_retry():
+    harness = WriterHarness(transient_failures=1)
+
+    with pytest.raises(pyodbc.OperationalError):
+        harness.writer.write([upsert_row("0000000001")], retry=False)
+    assert harness.reconnects == 0
+
+
+@needs_pyodbc
+def test_gives_up_after_max_retries():
+    harness = WriterHarness(transient_failures=10, max_retries=2)
+
+    with pytest.raises(pyodbc.OperationalError):
+        harness.writer.write([upsert_row("0000000001")])
+    assert harness.writer.retries == 2
+
+
+@needs_pyodbc
+def test_call_with_retry_uses_the_given_reconnect():
+    harness = WriterHarness()
+    calls = []
+    reconnects = []
+
+    def lookup():
+        calls.append(1)
+        if len(calls) == 1:
+            raise pyodbc.OperationalError("HYT00", "Query timeout")
+        return "T"
+
+    result = harness.writer.call_with_retry(
+        lookup, reconnect=lambda: reconnects.append(1)
+    )
+
+    assert result == "T"
+    assert reconnects == [1]
+    assert harness.reconnects == 0
+    assert harness.writer.retries == 1
+
+
+@needs_pyodbc
+def test_call_with_retry_counts_retries_with_on_retry():
+    harness = WriterHarness()
+    calls = []
+    retries = []
+
+    def lookup():
+        calls.append(1)
+        if len(calls) < 3:
+            raise pyodbc.OperationalError("HYT00", "Query timeout")
+        return "F"
+
+    result = harness.writer.call_with_retry(lookup, on_retry=lambda: retries.append(1))
+
+    assert result == "F"
+    assert retries == [1, 1]
+    assert harness.writer.retries == 0
+
+
+@needs_pyodbc
+def test_is_transient_error():
+    assert is_transient_error(pyodbc.OperationalError("08S01", "link"))
+    assert is_transient_error(pyodbc.Error("40001", "deadlock victim"))
+    assert not is_transient_error(pyodbc.DataError("22001", "truncation"))
+    assert not is_transient_error(ValueError("40001"))